@@ -0,0 +1,182 @@
+import json
+import os
+import sys
+import time
+import traceback
+from plgspl.metrics import timed
+
+# options a job may give, and their defaults. options given at the top of the manifest apply to every job.
+JOB_OPTIONS = {'out': '.', 'stream': False, 'cache': None, 'qmap': 'json', 'resume': False}
+# the least and most arguments each command takes
+COMMANDS = {'pdf': (2, 3), 'merge': (2, 3), 'classlist': (1, 1)}
+
+
+def parse_job(raw, base, defaults=JOB_OPTIONS):
+    '''
+        parses a job, e.g. {"pdf": [INFO_JSON, MANUAL_CSV, FILE_DIR], "out": DIR}, into (command, args, options),
+        with its paths made absolute against base. raises ValueError if the job isn't well formed.
+    '''
+    if not isinstance(raw, dict):
+        raise ValueError('a job should be an object')
+    commands = [c for c in COMMANDS if c in raw]
+    unknown = set(raw) - set(COMMANDS) - set(JOB_OPTIONS)
+    if len(commands) != 1 or unknown:
+        raise ValueError(f'a job should have one of {", ".join(COMMANDS)}, '
+                         f'and options from {", ".join(JOB_OPTIONS)}')
+    cmd = commands[0]
+    args = raw[cmd]
+    low, high = COMMANDS[cmd]
+    if not isinstance(args, list) or not low <= len(args) <= high:
+        raise ValueError(f'{cmd} takes {low} to {high} arguments')
+    options = dict(defaults, **{k: v for k, v in raw.items() if k in JOB_OPTIONS})
+    # merge's instance is a number, not a path
+    paths = args[:2] if cmd == 'merge' else args
+    if not all(isinstance(a, str) for a in paths):
+        raise ValueError(f'the paths given to {cmd} should be strings')
+    if cmd == 'merge' and len(args) == 3 and not str(args[2]).isdigit():
+        raise ValueError('the merge instance should be a number')
+    args =[os.path.join(base, a) for a in paths] + args[len(paths):]
+    options['out'] = os.path.join(base, options['out'])
+    if options['cache']:
+        options['cache'] = os.path.join(base, options['cache'])
+    return cmd, args, options
+
+
+def load_manifest(manifest_json):
+    '''
+        reads a batch manifest, returning its workers and its jobs, see parse_job
+    '''
+    try:
+        manifest = json.load(open(manifest_json))
+    except (OSError, ValueError) as e:
+        print(f'Unable to read the batch manifest {manifest_json}: {e}')
+        sys.exit(1)
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('jobs', []), list):
+        print(f'The batch manifest {manifest_json} should be an object with a list of jobs.')
+        sys.exit(1)
+    workers = manifest.get('workers', 1)
+    if isinstance(workers, bool) or not isinstance(workers, int) or workers < 1:
+        print(f'The workers in {manifest_json} should be a positive number, got {json.dumps(workers)}.')
+        sys.exit(1)
+    base = os.path.dirname(os.path.abspath(manifest_json))
+    defaults = dict(JOB_OPTIONS, **{k: v for k, v in manifest.items() if k in JOB_OPTIONS})
+    jobs = []
+    for n, raw in enumerate(manifest.get('jobs', []), 1):
+        try:
+            jobs.append(parse_job(raw, base, defaults))
+        except ValueError as e:
+            print(f'Job {n} in {manifest_json} is invalid: {e}.')
+            sys.exit(1)
+    return workers, jobs
+
+
+def check_job(cmd, args):
+    '''
+        returns why a job's inputs can't be found, as the cli would report it, or None if they can
+    '''
+    from plgspl.files import is_zip
+    for f in args[0:1 if cmd == 'classlist' else 2]:
+        if not os.path.isfile(f):
+            return "Unable to find the given file: %s" % f
+    if cmd == 'pdf' and len(args) == 3 and not (os.path.isdir(args[2]) or is_zip(args[2])):
+        return "Unable to find the given file directory: %s" % args[2]
+    return None
+
+
+def run_job(cmd, args, options, workers=1, pool=None, parsed=None, progress=None) -> dict:
+    '''
+        runs a job in its output directory, returning its summary.
+        a job that exits, as the commands do on bad input, or that raises is summarised as failed.
+        the traceback of an exception is printed and kept in the summary.
+        pool, parsed and progress are passed on to to_pdf.
+    '''
+    job = {'command': cmd, 'args': args, 'out': options['out']}
+    start = time.perf_counter()
+    cwd = os.getcwd()
+    try:
+        problem = check_job(cmd, args)
+        if problem:
+            print(problem)
+            sys.exit(1)
+        os.makedirs(options['out'], exist_ok=True)
+        os.chdir(options['out'])
+        with timed(f'batch.{cmd}'):
+            if cmd == 'pdf':
+                from plgspl.to_pdf import to_pdf
+                out_file, qmap, pdfs, missing, truncated = to_pdf(
+                    args[0], args[1], args[2] if len(args) == 3 else None, workers=workers,
+                    stream=options['stream'], cache_dir=options['cache'], qmap_format=options['qmap'],
+                    resume=options['resume'], pool=pool, parsed=parsed, progress=progress)
+                job.update({'title': out_file, 'students': len(qmap),
+                            'pdfs': len(set(pdfs.values())),
+                            'missing': len(missing), 'truncated': len(truncated)})
+            elif cmd == 'merge':
+                from plgspl.merge import merge
+                merge(args[0], args[1], int(args[2]) if len(args) == 3 else 1)
+            else:
+                from plgspl.classlist import classlist
+                classlist(args[0])
+        job['status'] = 'ok'
+    except SystemExit as e:
+        # the command has already printed why
+        job['status'] = 'failed'
+        job['exit'] = e.code
+    except Exception:
+        # e.g. a qmap that doesn't match the gradescope csv, or a pdf fpdf can't write
+        job['status'] = 'failed'
+        job['error'] = traceback.format_exc()
+        print(job['error'])
+    finally:
+        os.chdir(cwd)
+        job['seconds'] = round(time.perf_counter() - start, 3)
+    return job
+
+
+def describe(job) -> str:
+    if 'title' not in job:
+        return f"{job['command']} {' '.join(os.path.basename(str(a)) for a in job['args'])}"
+    return (f"{job['title']}: {job['students']} student(s) in {job['pdfs']} pdf(s), "
+            f"{job['missing']} missing questions, {job['truncated']} truncated parts")
+
+
+def batch(manifest_json, summary_json, workers=None):
+    '''
+        runs every job in a batch manifest in this process, one after another, then writes a summary of them all.
+        the pdf jobs share one pool of workers, and with it the images and markdown each worker has cached,
+        rather than paying for fresh processes and fresh caches per assessment.
+        a job that fails is reported, and the batch moves on to the next one.
+    '''
+    manifest_workers, jobs = load_manifest(manifest_json)
+    workers = workers or manifest_workers
+    # a merge job's qmap may come from an earlier job, so only pdf inputs are checked up front
+    for cmd, args, _ in jobs:
+        problem = check_job(cmd, args) if cmd == 'pdf' else None
+        if problem:
+            print(problem)
+            sys.exit(1)
+
+    pool = None
+    if workers > 1 and any(cmd == 'pdf' for cmd, _, _ in jobs):
+        from plgspl.to_pdf import make_pool
+        pool = make_pool(workers)
+    summary = []
+    start = time.perf_counter()
+    try:
+        for n, (cmd, args, options) in enumerate(jobs, 1):
+            print(f'Running job {n} of {len(jobs)}: {cmd} {" ".join(map(str, args))}', end='\n\n')
+            summary.append(run_job(cmd, args, options, workers, pool))
+    finally:
+        if pool:
+            pool.shutdown()
+
+    failed = sum(job['status'] != 'ok' for job in summary)
+    report = {'workers': workers, 'seconds': round(time.perf_counter() - start, 3),
+              'failed': failed, 'jobs': summary}
+    json.dump(report, open(summary_json, 'w'), indent=2)
+    print(f'Ran {len(summary)} job(s) in {report["seconds"]:.1f}s:')
+    for job in summary:
+        print(f"  {job['status']:>6} {job['seconds']:8.1f}s  {describe(job)}")
+    print(f'Wrote the batch summary to {summary_json}')
+    if failed:
+        print(f'{failed} job(s) failed.')
+        sys.exit(1)
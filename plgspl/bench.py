@@ -0,0 +1,199 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import plgspl.synthetic as synthetic
+
+PAGE = re.compile(rb'/Type /Page\n')
+
+# the most seconds each command should take on a one student export beyond a bare interpreter's startup,
+# which is mostly imports. pdf needs fpdf and pandas, classlist and merge need pandas, combine and qmap need neither.
+# each is about twice what it measures, so only a new heavy import, not noise, goes over.
+STARTUP_BUDGETS = {'pdf': 1.2, 'plan': 1.2, 'classlist': 1.0,
+                   'merge': 1.0, 'combine': 0.15, 'qmap': 0.15}
+
+
+def peak_rss() -> int:
+    '''
+        returns the peak resident memory of the current process, in bytes
+    '''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos reports bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_stage(stage, args, kwargs, cwd, results):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        os.chdir(cwd)
+        start = time.perf_counter()
+        if stage == 'pdf':
+            from plgspl.to_pdf import to_pdf
+            to_pdf(*args, **kwargs)
+        elif stage == 'merge_partials':
+            from plgspl.merge import merge_partials
+            merge_partials(*args)
+        elif stage == 'merge_total':
+            from plgspl.merge import merge_total
+            merge_total(*args)
+        elif stage == 'classlist':
+            from plgspl.classlist import classlist
+            classlist(*args)
+        results.put({'seconds': time.perf_counter() - start, 'peak_rss': peak_rss()})
+
+
+def measure(stage, args, cwd, **kwargs) -> dict:
+    '''
+        runs a stage in a fresh process, so that its peak memory is its own
+    '''
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    p = ctx.Process(target=run_stage, args=(
+        stage, args, kwargs, cwd, results))
+    p.start()
+    p.join()
+    if p.exitcode != 0:
+        raise RuntimeError(f'{stage} failed with exit code {p.exitcode}')
+    return results.get()
+
+
+def count_pages(out_dir) -> int:
+    return sum(len(PAGE.findall(open(os.path.join(out_dir, fn), 'rb').read()))
+               for fn in os.listdir(out_dir) if fn.endswith('.pdf') and not fn.endswith('_sample.pdf'))
+
+
+def bench(data_dir, out_dir, generate_opts, pdf_opts=dict()) -> dict:
+    '''
+        generates a synthetic export in data_dir, then times each plgspl stage over it.
+        returns a report of seconds, throughput and peak memory per stage.
+    '''
+    summary = synthetic.generate(data_dir, **generate_opts)
+    info_json, manual_csv = os.path.join(
+        data_dir, 'info.json'), os.path.join(data_dir, 'ans.csv')
+    gs_csv = os.path.join(data_dir, 'gs_scores.csv')
+    qmap_json = os.path.join(out_dir, 'Synthetic_Assessment_qmap.json')
+
+    report = {'dataset': summary, 'stages': dict()}
+    stages = [('pdf', (info_json, manual_csv, os.path.join(data_dir, 'files')), pdf_opts, summary['rows']),
+              ('merge_partials', (qmap_json, gs_csv), {}, summary['students']),
+              ('merge_total', (qmap_json, gs_csv), {}, summary['students']),
+              ('classlist', (os.path.join(data_dir, 'classlist.csv'),), {}, summary['students'])]
+    for stage, args, kwargs, rows in stages:
+        result = measure(stage, args, out_dir, **kwargs)
+        result['rows_per_second'] = rows / result['seconds']
+        if stage == 'pdf':
+            result['pages'] = count_pages(out_dir)
+            result['pages_per_second'] = result['pages'] / result['seconds']
+        report['stages'][stage] = result
+    return report
+
+
+def startup(data_dir, out_dir, repeat=5) -> dict:
+    '''
+        times each plgspl command as the cli runs it, in a fresh interpreter, over a one student export.
+        returns the best of repeat runs and the target for each command, its budget past the best of repeat
+        runs of a bare interpreter, timed the same way.
+    '''
+    synthetic.generate(data_dir, students=1, questions=2, image_size=16)
+    info_json, manual_csv, file_dir = (os.path.join(data_dir, f) for f in ('info.json', 'ans.csv', 'files'))
+    qmap_json = os.path.join(out_dir, 'Synthetic_Assessment_qmap.json')
+    commands = {'pdf': ['pdf', info_json, manual_csv, file_dir],
+                'plan': ['pdf', info_json, manual_csv, file_dir, '--plan'],
+                'classlist': ['classlist', os.path.join(data_dir, 'classlist.csv')],
+                'merge': ['merge', qmap_json, os.path.join(data_dir, 'gs_scores.csv')],
+                'combine': ['combine', os.path.join(out_dir, 'Synthetic_Assessment_shard-1-of-1.json')],
+                'qmap': ['qmap', qmap_json, os.path.join(out_dir, 'qmap.db')]}
+
+    def run(args):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=out_dir,
+                       stdout=subprocess.DEVNULL, check=True)
+        return time.perf_counter() - start
+
+    # the qmap and shard file the later commands read
+    run(['-m', 'plgspl', *commands['pdf'], '--shard', '1/1'])
+    run(['-m', 'plgspl', *commands['pdf']])
+    bare = min(run(['-c', 'pass']) for _ in range(repeat))
+    return {cmd: {'seconds': min(run(['-m', 'plgspl', *args]) for _ in range(repeat)),
+                  'target': bare + STARTUP_BUDGETS[cmd]}
+            for cmd, args in commands.items()}
+
+
+def compare(report, baseline, tolerance):
+    '''
+        prints each stage's time against a baseline report.
+        returns the stages that are slower than the baseline by more than tolerance.
+    '''
+    regressions = []
+    for stage, result in report['stages'].items():
+        old = baseline['stages'].get(stage)
+        if not old:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        print(f'{stage:>16}: {ratio:.2f}x baseline time')
+        if ratio > 1 + tolerance:
+            regressions.append(stage)
+    return regressions
+
+
+def main():
+    from plgspl.plgspl import pop_flag, pop_option
+    args = sys.argv[1:]
+    if pop_flag(args, 'startup'):
+        return main_startup(args)
+    generate_opts = synthetic.pop_options(args)
+    pdf_opts = dict(workers=pop_option(args, 'workers', 1, int),
+                    stream=pop_flag(args, 'stream'))
+    out = pop_option(args, 'out')
+    baseline = pop_option(args, 'compare')
+    tolerance = pop_option(args, 'tolerance', 0.2, float)
+    if args:
+        print('Unknown arguments:', ' '.join(args))
+        print('Usage: python -m plgspl.bench [--startup] [--students N] ... [--out REPORT_JSON] [--compare REPORT_JSON]')
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as out_dir:
+        report = bench(data_dir, out_dir, generate_opts, pdf_opts)
+
+    print(f"{report['dataset']['students']} students, {report['dataset']['rows']} rows, {report['dataset']['files']} files")
+    for stage, r in report['stages'].items():
+        pages = f", {r['pages_per_second']:.1f} pages/s" if 'pages' in r else ''
+        print(f"{stage:>16}: {r['seconds']:.3f}s, {r['rows_per_second']:.1f} rows/s{pages}, "
+              f"peak rss {r['peak_rss'] / 2 ** 20:.1f} MiB")
+    if out:
+        json.dump(report, open(out, 'w'), indent=2)
+    if baseline:
+        regressions = compare(report, json.load(open(baseline)), tolerance)
+        if regressions:
+            print('Regressions:', ', '.join(regressions))
+            sys.exit(1)
+
+
+def main_startup(args):
+    from plgspl.plgspl import pop_option
+    repeat = pop_option(args, 'repeat', 5, int)
+    out = pop_option(args, 'out')
+    if args:
+        print('Unknown arguments:', ' '.join(args))
+        print('Usage: python -m plgspl.bench --startup [--repeat N] [--out REPORT_JSON]')
+        sys.exit(1)
+    with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as out_dir:
+        report = startup(data_dir, out_dir, repeat)
+
+    for cmd, r in report.items():
+        print(f"{cmd:>10}: {r['seconds']:.3f}s, target {r['target']:.2f}s")
+    if out:
+        json.dump({'startup': report}, open(out, 'w'), indent=2)
+    slow = [cmd for cmd, r in report.items() if r['seconds'] > r['target']]
+    if slow:
+        print('Over target:', ', '.join(slow))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import tempfile
+from plgspl.cfg import cfg
+from plgspl.files import file_digest
+from plgspl.types import PDF, ENTRY_STATE, EXIT_STATE, FORM_OP
+
+FONT_OP = re.compile(r'BT /F(\d+) ([\d.]+) Tf ET')
+IMAGE_OP = re.compile(r'/I(\d+) Do')
+
+
+def sha(*parts) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p if isinstance(p, bytes) else str(p).encode('utf-8'))
+        h.update(b'\x1f')
+    return h.hexdigest()
+
+
+def source_digest() -> str:
+    '''
+        hashes the plgspl sources, so that cached pages are dropped whenever the renderer changes
+    '''
+    root = os.path.dirname(__file__)
+    return sha(*(open(os.path.join(root, fn), 'rb').read()
+                 for fn in sorted(os.listdir(root)) if fn.endswith('.py')))
+
+
+def capture_state(pdf: PDF, keys=ENTRY_STATE) -> dict:
+    state = {k: getattr(pdf, k) for k in keys}
+    current_font = getattr(pdf, 'current_font', None)
+    state['font'] = next((k for k, f in pdf.fonts.items() if f is current_font), None)
+    return state
+
+
+def capture(pdf: PDF, start: int, missing: bool, truncated=()) -> dict:
+    '''
+        captures the pages rendered after page start as a reusable fragment.
+        fonts and images are stored by key, and forms by their content, so the fragment can be spliced into any pdf.
+    '''
+    pages = [pdf.pages[n] for n in range(start + 1, pdf.page + 1)]
+    fonts = {f['i']: k for k, f in pdf.fonts.items()}
+    images = {i['i']: k for k, i in pdf.images.items()}
+    forms = {i: ops for ops, i in pdf.forms.items()}
+    used_forms = {int(m.group(1)): forms[int(m.group(1))]
+                  for page in pages for m in FORM_OP.finditer(page)}
+    used_fonts, used_images = [], []
+    for page in pages + list(used_forms.values()):
+        for m in FONT_OP.finditer(page):
+            key = fonts[int(m.group(1))]
+            if key not in used_fonts:
+                used_fonts.append(key)
+        for m in IMAGE_OP.finditer(page):
+            name = images[int(m.group(1))]
+            if name not in used_images:
+                used_images.append(name)
+
+    def strip(info):
+        return {k: v for k, v in info.items() if k != 'i'}
+    return {
+        'pages': pages,
+        'links': {n - start: pdf.page_links[n] for n in range(start + 1, pdf.page + 1) if n in pdf.page_links},
+        'fonts': [(pdf.fonts[k]['i'], k, strip(pdf.fonts[k])) for k in used_fonts],
+        'images': [(pdf.images[k]['i'], k, strip(pdf.images[k])) for k in used_images],
+        'forms': list(used_forms.items()),
+        'state': capture_state(pdf, EXIT_STATE),
+        'missing': missing,
+        'truncated': list(truncated)
+    }
+
+
+def splice(pdf: PDF, fragment: dict) -> bool:
+    '''
+        appends the fragment's pages to the pdf, registering any fonts or images it needs,
+        and leaves the pdf in the state the fragment was rendered into.
+        returns whether the fragment's submission was missing questions.
+        what the submission had truncated is noted on the pdf again.
+    '''
+    fonts, images = dict(), dict()
+    for i, key, font in fragment['fonts']:
+        if key not in pdf.fonts:
+            pdf.fonts[key] = dict(font, i=len(pdf.fonts) + 1)
+        fonts[i] = pdf.fonts[key]['i']
+    for i, name, info in fragment['images']:
+        if name not in pdf.images:
+            pdf.images[name] = dict(info, i=len(pdf.images) + 1)
+            # fpdf bumps the version when it parses an image with an alpha channel
+            if 'smask' in info and pdf.pdf_version < '1.4':
+                pdf.pdf_version = '1.4'
+        images[i] = pdf.images[name]['i']
+
+    def renumber_fonts(ops):
+        if any(i != j for i, j in fonts.items()):
+            return FONT_OP.sub(lambda m: 'BT /F%d %s Tf ET' % (fonts[int(m.group(1))], m.group(2)), ops)
+        return ops
+    forms = {i: pdf.add_form(renumber_fonts(ops)) for i, ops in fragment.get('forms', [])}
+    for page in fragment['pages']:
+        for m in FORM_OP.finditer(page):
+            pdf.form_uses[forms[int(m.group(1))]] += 1
+
+    if pdf.state == 0:
+        pdf.open()
+    start = pdf.page
+    for n, page in enumerate(fragment['pages'], 1):
+        page = renumber_fonts(page)
+        if any(i != j for i, j in images.items()):
+            page = IMAGE_OP.sub(lambda m: '/I%d Do' %
+                                images[int(m.group(1))], page)
+        if any(i != j for i, j in forms.items()):
+            page = FORM_OP.sub(lambda m: '/X%d Do' % forms[int(m.group(1))], page)
+        pdf.pages[start + n] = page
+        if n in fragment['links']:
+            pdf.page_links[start + n] = list(fragment['links'][n])
+    pdf.page = start + len(fragment['pages'])
+    pdf.state = 2
+
+    state = dict(fragment['state'])
+    font = state.pop('font')
+    for k, v in state.items():
+        setattr(pdf, k, v)
+    if font:
+        pdf.current_font = pdf.fonts[font]
+        pdf.unifontsubset = pdf.current_font['type'] == 'TTF'
+    pdf.truncated.extend(fragment.get('truncated', []))
+    return fragment['missing']
+
+
+class RenderCache:
+    '''
+        a content-addressed cache of rendered submissions and written chunk pdfs.
+
+        a submission is keyed on its csv rows and file contents, the assessment config,
+        the plgspl defaults and the plgspl sources. reused submissions are spliced into the
+        output instead of rendered, and chunks whose submissions didn't change aren't rewritten.
+    '''
+
+    def __init__(self, cache_dir, info_json):
+        self.dir = cache_dir
+        self.salt = sha(open(info_json, 'rb').read(),
+                        json.dumps(cfg, sort_keys=True), source_digest())
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.manifest = None
+        os.makedirs(os.path.join(cache_dir, 'fragments'), exist_ok=True)
+
+    def __getstate__(self):
+        # worker processes only read and write fragments
+        return dict(self.__dict__, manifest=None)
+
+    def row_digest(self, row) -> str:
+        return sha(*row.values)
+
+    def student_key(self, submission) -> str:
+        '''
+            returns the key of a submission's csv rows and uploaded files
+        '''
+        if submission.cache_key is None:
+            files = [file_digest(p, sq.file_bundle.source)
+                     for sq in submission.questions.values()
+                     for p in sq.file_bundle.files.values()]
+            # the order file parts are drawn in, so a reordered config never reuses stale pages
+            order = json.dumps([sq.file_names for sq in submission.questions.values()])
+            submission.cache_key = sha(self.salt, submission.uid,
+                                       *submission.row_digests, *files, order)
+        return submission.cache_key
+
+    def fragment_key(self, submission, first, template_submission, expected_pages, state) -> str:
+        return sha(self.student_key(submission), first, self.student_key(template_submission),
+                   expected_pages, json.dumps(state, sort_keys=True))
+
+    def fragment_path(self, key):
+        return os.path.join(self.dir, 'fragments', f'{key}.pkl')
+
+    def load(self, key):
+        try:
+            with open(self.fragment_path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def store(self, key, fragment):
+        # write then rename, so concurrent workers never see a partial fragment
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.dir, 'fragments'))
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(fragment, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.fragment_path(key))
+
+    def chunk_key(self, keys, offset, template_submission, expected_pages) -> str:
+        '''
+            returns the key of a chunk pdf, given the student keys of its submissions
+        '''
+        return sha(self.student_key(template_submission), expected_pages, offset, *keys)
+
+    def get_manifest(self) -> dict:
+        if self.manifest is None:
+            try:
+                self.manifest = json.load(open(self.manifest_path))
+            except (OSError, ValueError):
+                self.manifest = dict()
+        return self.manifest
+
+    def unchanged(self, path, key):
+        '''
+            returns the recorded entry for path if its pdf still exists and was written from key
+        '''
+        entry = self.get_manifest().get(path)
+        if entry and entry['key'] == key and os.path.isfile(path):
+            return entry
+        return None
+
+    def record(self, path, key, missing=[], truncated=[]):
+        self.get_manifest()[path] = {'key': key, 'missing': missing, 'truncated': truncated}
+
+    def save(self):
+        if self.manifest is not None:
+            json.dump(self.manifest, open(self.manifest_path, 'w'), indent=2)
@@ -1,9 +1,29 @@
 import json
 import os
+import sys
+from dataclasses import dataclass
 from functools import reduce
+from typing import FrozenSet, List
 
-cfg = json.load(
-    open(os.path.join(os.path.dirname(__file__), '__defaults.json')))
+
+def load():
+    '''
+        reads and checks the plgspl defaults, the first time they're asked for.
+        cfg and settings are read as attributes of this module, so commands that
+        never import them, like classlist, skip reading the defaults.
+    '''
+    global cfg, settings
+    if 'settings' not in globals():
+        cfg = json.load(
+            open(os.path.join(os.path.dirname(__file__), '__defaults.json')))
+        settings = compile_cfg(cfg)
+
+
+def __getattr__(name):
+    if name in ('cfg', 'settings'):
+        load()
+        return globals()[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def get_cfg(*keys, default=None, cast=lambda x: x):
@@ -13,8 +33,177 @@ def get_cfg(*keys, default=None, cast=lambda x: x):
         if the cast fails or the value dne, the default is returned
     '''
     v = reduce(lambda d, key: d.get(key, default) if isinstance(
-        d, dict) else default, keys, globals()['cfg'])
+        d, dict) else default, keys, __getattr__('cfg'))
     try:
         return cast(v)
     except:
         return default
+
+
+@dataclass(frozen=True)
+class Color:
+    r: int
+    g: int
+    b: int
+
+
+@dataclass(frozen=True)
+class Font:
+    font: str
+    size: int
+    line: Color = None
+
+
+@dataclass(frozen=True)
+class Anchor:
+    text: str
+    fill: Color
+
+
+@dataclass(frozen=True)
+class Settings:
+    '''
+        the plgspl defaults, read and checked once, the first time a module asks for them, see load.
+        rendering code reads these attributes rather than walking the raw config.
+    '''
+    pages_per_pdf: int
+    max_pdf_bytes: int
+    max_pages_default: int
+    max_pages_file: int
+    max_pages_string: int
+    truncate_overflow: bool
+    code_exts: FrozenSet[str]
+    pic_exts: FrozenSet[str]
+    md_exts: FrozenSet[str]
+    image_downscale: bool
+    image_dpi: int
+    image_jpeg_quality: int
+    image_max_px: int
+    image_cache_dir: str
+    markdown_cache_mb: int
+    image_cache_mb: int
+    dump_params: bool
+    merge_method: str
+    line_width: int
+    line_height: int
+    title_font: Font
+    header_font: Font
+    subheader_font: Font
+    body_font: Font
+    code_font: Font
+    anchor_height: float
+    blank_anchor: Anchor
+    incorrect_anchor: Anchor
+    partial_anchor: Anchor
+    correct_anchor: Anchor
+
+
+REQUIRED = object()
+
+
+def compile_cfg(raw: dict) -> Settings:
+    '''
+        checks the given config against the fields plgspl uses, returning them as settings.
+        every problem is reported at once, and plgspl exits before anything is rendered.
+    '''
+    errors: List[str] = []
+
+    def get(*keys, cast, default=REQUIRED):
+        v = raw
+        for k in keys:
+            if not isinstance(v, dict) or k not in v:
+                if default is REQUIRED:
+                    errors.append(f'{".".join(keys)} is missing')
+                return None if default is REQUIRED else default
+            v = v[k]
+        try:
+            return cast(v)
+        except (TypeError, ValueError, KeyError):
+            errors.append(
+                f'{".".join(keys)} should be {cast.__doc__}, got {json.dumps(v)}')
+            return None
+
+    def text(v):
+        'a string'
+        if not isinstance(v, str):
+            raise TypeError()
+        return v
+
+    def integer(v):
+        'a number'
+        if isinstance(v, bool):
+            raise TypeError()
+        return int(v)
+
+    def number(v):
+        'a number'
+        if isinstance(v, bool):
+            raise TypeError()
+        return float(v)
+
+    def flag(v):
+        'true or false'
+        if not isinstance(v, bool):
+            raise TypeError()
+        return v
+
+    def exts(v):
+        'a list of extensions'
+        if not isinstance(v, list):
+            raise TypeError()
+        return frozenset(map(text, v))
+
+    def color(v):
+        'an {"r", "g", "b"} object'
+        return Color(integer(v['r']), integer(v['g']), integer(v['b']))
+
+    def font(*keys, font=REQUIRED, size=REQUIRED, line=False):
+        return Font(get(*keys, 'font', cast=text, default=font),
+                    get(*keys, 'size', cast=integer, default=size),
+                    get(*keys, 'line', cast=color) if line else None)
+
+    def anchor(name):
+        return Anchor(get('gsAnchor', name, 'text', cast=text),
+                      get('gsAnchor', name, 'fill', cast=color))
+
+    settings = Settings(
+        pages_per_pdf=get('gs', 'pagesPerPDF', cast=integer),
+        max_pdf_bytes=get('gs', 'maxMB', cast=number, default=0) * 2 ** 20,
+        max_pages_default=get('maxPages', 'default', cast=integer, default=1),
+        max_pages_file=get('maxPages', 'file', cast=integer, default=1),
+        max_pages_string=get('maxPages', 'string', cast=integer, default=1),
+        truncate_overflow=get('maxPages', 'truncate', cast=flag, default=False),
+        code_exts=get('files', 'code', cast=exts),
+        pic_exts=get('files', 'pics', cast=exts),
+        md_exts=get('files', 'md', cast=exts),
+        image_downscale=get('images', 'downscale', cast=flag, default=False),
+        image_dpi=get('images', 'dpi', cast=integer, default=150),
+        image_jpeg_quality=get('images', 'jpegQuality',
+                               cast=integer, default=80),
+        image_max_px=get('images', 'maxPixels', cast=integer, default=2400),
+        image_cache_dir=get('images', 'cacheDir', cast=text, default=''),
+        markdown_cache_mb=get('contentCache', 'markdownMB',
+                              cast=integer, default=16),
+        image_cache_mb=get('contentCache', 'imagesMB',
+                           cast=integer, default=256),
+        dump_params=get('questions', 'dumpParams', cast=flag, default=False),
+        merge_method=get('questions', 'mergeMethod',
+                         cast=text, default='partial'),
+        line_width=get('page', 'lineWidth', cast=integer, default=180),
+        line_height=get('page', 'lineHeight', cast=integer, default=0),
+        title_font=font('font', 'title', font='arial', size=10),
+        header_font=font('font', 'header', line=True),
+        subheader_font=font('font', 'subheader', line=True),
+        body_font=font('font', 'body', font='arial', size=10),
+        code_font=font('font', 'code'),
+        anchor_height=get('gsAnchor', 'height', cast=number),
+        blank_anchor=anchor('blank'),
+        incorrect_anchor=anchor('incorrect'),
+        partial_anchor=anchor('partial'),
+        correct_anchor=anchor('correct'))
+    if errors:
+        print('Invalid plgspl config:')
+        for e in errors:
+            print(f'  - {e}')
+        sys.exit(1)
+    return settings
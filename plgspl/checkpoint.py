@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+from plgspl.cache import sha, source_digest
+from plgspl.cfg import cfg
+
+
+def stat_key(path):
+    if not path:
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def run_key(info_json, manual_csv, file_dir=None, shard=None) -> str:
+    '''
+        returns the key of a pdf run's inputs. the csv and file directory are keyed on their size and
+        modification time, as a fresh export from pl always changes those.
+    '''
+    return sha(open(info_json, 'rb').read(), json.dumps(cfg, sort_keys=True), source_digest(),
+               stat_key(manual_csv), file_dir, stat_key(file_dir),
+               f'{shard.index}/{shard.count}' if shard else '')
+
+
+def checkpoint_path(out_file, shard=None):
+    return f'{out_file}{f"_shard-{shard.index}-of-{shard.count}" if shard else ""}_checkpoint.jsonl'
+
+
+class Checkpoint():
+    '''
+        an append only record of the chunk pdfs a pdf run has finished, so a run that stops partway
+        can be resumed. the first line describes the run: its inputs, template and expected pages.
+        each further line is a finished chunk, with its missing and truncated reports and qmap entries.
+        a line is only written once its pdf is on disk, and a torn last line is ignored.
+    '''
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.header = None
+        # finished chunks by the index of their first submission
+        self.chunks = dict()
+        self.file = None
+        # chunks are recorded from the threads that write them
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, key, resume=False):
+        '''
+            opens the checkpoint at path. when resuming, the chunks it records as finished are
+            reused, as long as it was written by a run of the same inputs.
+        '''
+        checkpoint = cls(path, key)
+        if resume:
+            checkpoint.read()
+            if checkpoint.header is None:
+                print(f'No checkpoint of this run to resume in {path}, starting from the first pdf.')
+            else:
+                print(f'Resuming from {path}, after {len(checkpoint.chunks)} finished pdf(s)...')
+        return checkpoint
+
+    def read(self):
+        try:
+            lines = open(self.path).read().splitlines()
+        except OSError:
+            return
+        for n, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if n == 0:
+                if entry.get('run') != self.key:
+                    return
+                self.header = entry
+            else:
+                self.chunks[entry['start']] = entry
+
+    def start(self, template_uid, expected_pages, max_submissions):
+        '''
+            starts writing the checkpoint, keeping the chunks read from an earlier run if it
+            rendered from the same template.
+        '''
+        header = {'run': self.key, 'template': template_uid,
+                  'expected_pages': expected_pages, 'max_submissions': max_submissions}
+        if self.header == header:
+            self.file = open(self.path, 'a')
+            return
+        if self.header:
+            print('The checkpoint was written with a different template, starting from the first pdf.')
+        self.header = header
+        self.chunks = dict()
+        self.file = open(self.path, 'w')
+        self.write(header)
+
+    def finished(self, start):
+        '''
+            returns the recorded chunk starting at submission start, if its pdf is still there
+        '''
+        entry = self.chunks.get(start)
+        if entry and os.path.isfile(os.path.join(os.getcwd(), entry['name'])):
+            return entry
+        return None
+
+    def record(self, start, path, result, qmap):
+        self.write({'start': start, 'name': os.path.basename(path),
+                    'missing': result[0], 'truncated': result[1], 'qmap': qmap})
+
+    def record_when_written(self, future, start, path, qmap, worker=False):
+        '''
+            records the chunk as soon as future has written its pdf, on the thread that finishes it,
+            rather than when the run next waits on it. a chunk written just before a crash is then still resumed.
+            a worker's future also returns the metrics it recorded and its output, see render_chunk_in_worker.
+        '''
+        def done(future):
+            if not future.cancelled() and future.exception() is None:
+                result = future.result()
+                self.record(start, path, result[0] if worker else result, qmap)
+        future.add_done_callback(done)
+
+    def write(self, entry):
+        with self.lock:
+            # a chunk may finish writing after the run has stopped and closed the checkpoint, see close
+            if not self.file:
+                return
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        '''
+            stops writing the checkpoint, leaving it to resume from. chunks finished after this aren't recorded.
+        '''
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def remove(self):
+        '''
+            drops the checkpoint once the run has written all of its outputs
+        '''
+        self.close()
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
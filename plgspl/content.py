@@ -0,0 +1,53 @@
+import hashlib
+from collections import OrderedDict
+from plgspl.cfg import settings
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache():
+    '''
+        a mapping bounded by the total size of its values, evicting the least recently used first.
+        values bigger than the whole cache are never kept.
+    '''
+
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value[0]
+
+    def put(self, key, value):
+        if key in self.entries:
+            return
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+
+
+def image_size(entry) -> int:
+    info, _ = entry
+    return sum(len(info.get(k) or '') for k in ('data', 'smask', 'pal'))
+
+
+# content addressed, so identical uploads from different students are converted once per process
+markdown_cache = LRUCache(settings.markdown_cache_mb << 20)
+image_cache = LRUCache(settings.image_cache_mb << 20, image_size)
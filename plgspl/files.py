@@ -0,0 +1,149 @@
+import hashlib
+import os
+import re
+import zipfile
+from typing import Dict, Iterable, List
+
+
+def escape_qid(qid):
+    '''
+        Replaces all "special" characters in the qid that should be underscores in the db
+    '''
+    return qid.replace("/", "_")
+
+
+def parse_filename(raw: str, qid):
+    '''
+        parses a pl filename, assuming it belongs to a question
+        with the given question id.
+    '''
+    parsed = raw.rsplit(escape_qid(qid) + "_",
+                        1).pop().split("_", 1).pop()
+    return parsed
+
+
+class ZipSource():
+    '''
+        reads student files straight out of a pl "_files_for_manual_grading.zip".
+        members are opened lazily through the zip's central directory; nothing is extracted.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = None
+
+    def __getstate__(self):
+        # open archives can't cross process boundaries; each process reopens its own
+        return {'path': self.path, '_zip': None}
+
+    @property
+    def zip(self) -> zipfile.ZipFile:
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.path)
+        return self._zip
+
+    def names(self) -> List[str]:
+        return [i.filename for i in self.zip.infolist() if not i.is_dir()]
+
+    def open(self, name):
+        '''
+            returns a binary file object for the given member
+        '''
+        return self.zip.open(name)
+
+    def size(self, name) -> int:
+        return self.zip.getinfo(name).file_size
+
+    def digest(self, name):
+        '''
+            returns a digest of the member's contents, read from the central directory
+        '''
+        info = self.zip.getinfo(name)
+        return f'{info.CRC:08x}:{info.file_size}'
+
+
+def open_file(path, source: ZipSource = None):
+    '''
+        opens a student file in binary mode, either from disk or from the given zip source
+    '''
+    return source.open(path) if source else open(path, 'rb')
+
+
+def file_size(path, source: ZipSource = None) -> int:
+    return source.size(path) if source else os.path.getsize(path)
+
+
+def file_digest(path, source: ZipSource = None) -> str:
+    '''
+        returns a digest of a student file's contents
+    '''
+    if source:
+        return source.digest(path)
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_zip(path) -> bool:
+    return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+
+class FileIndex():
+    '''
+        a one-time index over the filenames of a pl manual grading file export.
+
+        pl names uploads "<uid>_<uin>_<escaped qid>_<submission id>_<filename>".
+        we bucket each filename under every (escaped qid, submission id) pair it could
+        match, so a csv row only has to look at the handful of files in its own bucket
+        rather than scanning the whole directory.
+    '''
+
+    def __init__(self, names: Iterable[str], qids: Iterable[str], root='', source: ZipSource = None):
+        self.root = root
+        self.source = source
+        self.buckets: Dict[tuple, List[str]] = dict()
+        patterns = [re.compile('(?=(%s)_(\\d+))' % re.escape(e))
+                    for e in {escape_qid(q) for q in qids}]
+        # every digit prefix after "<eqid>_" is a key, mirroring the substring
+        # match on f'{eqid}_{sid}' that we used to run against each filename
+        for fn in names:
+            keys = set()
+            for pattern in patterns:
+                for m in pattern.finditer(fn):
+                    eqid, digits = m.group(1), m.group(2)
+                    for i in range(1, len(digits) + 1):
+                        keys.add((eqid, digits[:i]))
+            for k in keys:
+                self.buckets.setdefault(k, []).append(fn)
+
+    @classmethod
+    def from_dir(cls, file_dir, qids):
+        return cls(os.listdir(file_dir), qids, root=file_dir)
+
+    @classmethod
+    def from_zip(cls, zip_path, qids):
+        source = ZipSource(zip_path)
+        return cls(source.names(), qids, source=source)
+
+    @classmethod
+    def load(cls, file_dir, qids):
+        '''
+            indexes either an unzipped file directory or the zip itself
+        '''
+        if is_zip(file_dir):
+            return cls.from_zip(file_dir, qids)
+        return cls.from_dir(file_dir, qids)
+
+    def path(self, fn):
+        return os.path.join(self.root, fn)
+
+    def find(self, uid_full, qid, sid, expected_files) -> List[str]:
+        '''
+            returns the paths of the files uploaded by the given student for
+            the given question submission, in directory order.
+        '''
+        fns = self.buckets.get((escape_qid(qid), str(sid)), [])
+        return [self.path(fn) for fn in fns
+                if fn.find(uid_full) > -1 and parse_filename(fn, qid) in expected_files]
@@ -0,0 +1,124 @@
+import io
+import os
+import struct
+import tempfile
+from plgspl.cfg import settings
+from plgspl.content import digest
+
+MM_PER_INCH = 25.4
+# jpeg start of frame markers, which carry the image size
+JPEG_SOF = {0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf}
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+warned = False
+
+
+def dimensions(data: bytes):
+    '''
+        returns the pixel (width, height) of a png, gif or jpeg, read from its header,
+        or None if the image isn't one of those.
+    '''
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return struct.unpack('>II', data[16:24])
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', data[6:10])
+    if data[:2] != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xff:
+            return None
+        marker = data[i + 1]
+        if marker == 0xff:
+            i += 1
+        elif marker in JPEG_SOF:
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        else:
+            i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+
+def target_size(width, height, printed_mm=0):
+    '''
+        returns the pixel size an image should be resampled to, given the width it's printed at,
+        or None if it's already small enough.
+    '''
+    scale = settings.image_max_px / max(width, height)
+    if printed_mm > 0:
+        scale = min(scale, printed_mm / MM_PER_INCH * settings.image_dpi / width)
+    if scale >= 1:
+        return None
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def downscale(data: bytes, ext, printed_mm=0) -> bytes:
+    '''
+        resamples an image down to its printed size at the configured dpi.
+        jpegs are recompressed at the configured quality, and everything else is written back as a png.
+        returns the original bytes if that doesn't make the image any smaller.
+    '''
+    global warned
+    if Image is None:
+        if not warned:
+            print('Pillow is not installed, so images are embedded at full size. Run `pip install Pillow` to shrink them.')
+            warned = True
+        return data
+    try:
+        img = Image.open(io.BytesIO(data))
+        size = target_size(img.width, img.height, printed_mm)
+        if size is None:
+            return data
+        jpeg = ext.lower() in ('jpg', 'jpeg')
+        if not jpeg and img.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+            # fpdf can't read every png pillow can write, so stick to 8 bit grey or rgb
+            img = img.convert('RGBA' if 'transparency' in img.info or 'A' in img.mode else 'RGB')
+        img = img.resize(size, Image.LANCZOS)
+        out = io.BytesIO()
+        if jpeg:
+            img.save(out, 'JPEG', quality=settings.image_jpeg_quality, optimize=True)
+        else:
+            img.save(out, 'PNG')
+    except (OSError, ValueError) as e:
+        print(f'Unable to downscale an image, embedding it as is: {e}')
+        return data
+    return out.getvalue() if out.tell() < len(data) else data
+
+
+def cache_path(key, ext):
+    return os.path.join(os.path.expanduser(settings.image_cache_dir), f'{key}.{ext}')
+
+
+def prepare(key, data: bytes, ext, printed_mm=0) -> bytes:
+    '''
+        returns the bytes to embed for the image with the given content key.
+        downscaled images are kept on disk by source and settings, so later runs skip the resampling.
+    '''
+    if not settings.image_downscale:
+        return data
+    if not settings.image_cache_dir:
+        return downscale(data, ext, printed_mm)
+    path = cache_path(digest(b'%s:%d:%d:%d:%f' % (key.encode(), settings.image_dpi, settings.image_jpeg_quality,
+                                                  settings.image_max_px, printed_mm)), ext)
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        pass
+    out = downscale(data, ext, printed_mm)
+    if out is data:
+        # nothing to keep; checking the size again only reads the image header
+        return out
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so concurrent workers never see a partial image
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(out)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return out
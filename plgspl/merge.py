@@ -5,7 +5,8 @@ import numpy as np
 from functools import reduce
 from typing import List
 from math import ceil
-from plgspl.cfg import get_cfg
+from plgspl.cfg import settings
+from plgspl.qmap import load_qmap
 
 
 def get_part(q: str) -> str:
@@ -39,7 +40,7 @@ def get_question_number(q):
     return int(q.split(":", 1)[0].split(".", 1)[0])
 
 
-def merge(qmap_json, gs_csv, instance=1, method=get_cfg('questions', 'mergeMethod', default='partial')):
+def merge(qmap_json, gs_csv, instance=1, method=settings.merge_method):
     '''
         given a gradescope csv and a plgspl question map (per student),
         generates a "manual grading" csv for pl
@@ -52,34 +53,45 @@ def merge(qmap_json, gs_csv, instance=1, method=get_cfg('questions', 'mergeMetho
         print("Unsupported merge method.")
 
 
-def merge_total(qmap_json, gs_csv, instance=1):
+def parse_gs_questions(gs_question_parts: List[str]) -> List[List[dict]]:
     '''
-        given a gradescope csv and a plgspl question map (per student),
-        generates a "manual grading" csv for pl by just taking the overall score
-        of the given question, and uploading it as a final score.
-        this assumes that the weight of each part is equal to one.
-        it will try to use pre-existing partials when possible.
-
-        this re-weights each question part in accordance to the weights
-        detailed by the question config in pl.
+        given the question part columns of a gradescope csv,
+        returns the parts of each question in order, with their name and max points.
     '''
-    pl_qmap = json.load(open(qmap_json))
-    gs_df = pd.read_csv(gs_csv)
-
-    gs_question_parts = list(gs_df)[10:]
     gs_question_count = get_question_number(gs_question_parts[-1])
     gs_questions = [[] for _ in range(gs_question_count)]
 
     for p in gs_question_parts:
         qno = get_question_number(p) - 1
         gs_questions[qno].append({'part': get_part(p), 'max': parse_points(p)})
+    return gs_questions
 
-    csv_rows = []
-    for r in gs_df.itertuples():
-        email = r[1]
-        sid = str(r[2])
 
-        if r[4] == "Missing":
+def merge_scores(qmap_json, gs_csv):
+    '''
+        given a gradescope csv and a plgspl question map (per student), either json or sqlite,
+        yields the email, variant and merged partial scores of each question of each graded student.
+
+        the gradescope header is parsed once, and every part score is normalized by its max points
+        as a single matrix. only the per question partial scores are built row by row.
+    '''
+    pl_qmap = load_qmap(qmap_json)
+    gs_df = pd.read_csv(gs_csv)
+
+    gs_questions = parse_gs_questions(list(gs_df)[10:])
+    # the nth part score column is paired with the nth part in question order
+    parts = [p for parts in gs_questions for p in parts]
+    offsets = np.cumsum([0] + [len(parts) for parts in gs_questions]).tolist()
+    scores = gs_df.iloc[:, 10:10 + len(parts)].to_numpy(dtype=float) / \
+        np.array([p['max'] for p in parts])
+
+    emails = gs_df.iloc[:, 0].tolist()
+    sids = gs_df.iloc[:, 1].tolist()
+    totals = gs_df.iloc[:, 3].tolist()
+    graded = []
+    for email, sid, total, part_scores in zip(emails, sids, totals, scores.tolist()):
+        sid = str(sid)
+        if total == "Missing":
             '''
                 the student may not have a response on gradescope. in this case, we won't care,
                 we'll just leave the partial score that's currently in there
@@ -88,28 +100,45 @@ def merge_total(qmap_json, gs_csv, instance=1):
         elif sid == 'nan':
             print("Skipping unpaired student...")
             continue
+        graded.append((email, pl_qmap[sid][:len(gs_questions)], part_scores))
 
-        part_scores = list(r[11:])
-
-        for qInfo, parts in zip(pl_qmap[sid], gs_questions):
+    # decoding every pl partial score in one call is much cheaper than a json.loads per question
+    decoded = iter(json.loads('[%s]' % ','.join(
+        qInfo[1] for _, questions, _ in graded for qInfo in questions)))
+    for email, questions, part_scores in graded:
+        for qInfo, parts, start in zip(questions, gs_questions, offsets):
             variant = qInfo[0]
-            partial_scores = json.loads(qInfo[1])
-            for p in parts:
-                score = float(part_scores.pop(0)) / p['max']
+            partial_scores = next(decoded)
+            for p, score in zip(parts, part_scores[start:]):
                 if p['part'] in partial_scores:
                     partial_scores[p['part']]['score'] = score
                 else:
                     partial_scores[p['part']] = {'score': score, 'weight': 1}
+            yield email, variant, partial_scores
 
-            '''
-                code is more or mess copied from merge_partials, but we just calculate the total percentage score rather than the
-                individual parts, assuming that each part is max one point.
-            '''
-            partials = partial_scores.values()
-            total_weight = sum(p['weight'] for p in partials)
-            score_perc = ceil(100 * sum(p['score'] * (p['weight'] / total_weight)
-                                        for p in partials))
-            csv_rows.append([email, instance, variant, score_perc])
+
+def merge_total(qmap_json, gs_csv, instance=1):
+    '''
+        given a gradescope csv and a plgspl question map (per student),
+        generates a "manual grading" csv for pl by just taking the overall score
+        of the given question, and uploading it as a final score.
+        this assumes that the weight of each part is equal to one.
+        it will try to use pre-existing partials when possible.
+
+        this re-weights each question part in accordance to the weights
+        detailed by the question config in pl.
+    '''
+    csv_rows = []
+    for email, variant, partial_scores in merge_scores(qmap_json, gs_csv):
+        '''
+            we just calculate the total percentage score rather than the
+            individual parts, assuming that each part is max one point.
+        '''
+        partials = partial_scores.values()
+        total_weight = sum(p['weight'] for p in partials)
+        score_perc = ceil(100 * sum(p['score'] * (p['weight'] / total_weight)
+                                    for p in partials))
+        csv_rows.append([email, instance, variant, score_perc])
     pl_df = pd.DataFrame(
         csv_rows, columns=['uid', 'instance', 'qid', 'score_perc'])
     pl_df.to_csv('pl_scores.csv', index=False)
@@ -121,40 +150,8 @@ def merge_partials(qmap_json, gs_csv, instance=1):
         generates a "manual grading" csv for pl using pl's partial score uploads
         (not supported by pl atm)
     '''
-    pl_qmap = json.load(open(qmap_json))
-    gs_df = pd.read_csv(gs_csv)
-
-    gs_question_parts = list(gs_df)[10:]
-    gs_question_count = get_question_number(gs_question_parts[-1])
-    gs_questions = [[] for _ in range(gs_question_count)]
-
-    for p in gs_question_parts:
-        qno = get_question_number(p) - 1
-        gs_questions[qno].append({'part': get_part(p), 'max': parse_points(p)})
-
-    csv_rows = []
-    for r in gs_df.itertuples():
-        email = r[1]
-        sid = str(r[2])
-
-        if r[4] == "Missing":
-            continue
-
-        part_scores = list(r[11:])
-        for qInfo, parts in zip(pl_qmap[sid], gs_questions):
-            variant = qInfo[0]
-            partial_scores = json.loads(qInfo[1])
-
-            for p in parts:
-                score = float(part_scores.pop(0)) / p['max']
-                if p['part'] in partial_scores:
-                    partial_scores[p['part']]['score'] = score
-                else:
-                    partial_scores[p['part']] = {'score': score, 'weight': 1}
-
-            csv_rows.append([email, instance, variant,
-                             json.dumps(partial_scores)])
-
+    csv_rows = [[email, instance, variant, json.dumps(partial_scores)]
+                for email, variant, partial_scores in merge_scores(qmap_json, gs_csv)]
     pl_df = pd.DataFrame(
         csv_rows, columns=['uid', 'instance', 'qid', 'partial_scores'])
     pl_df.to_csv('pl_scores.csv', index=False)
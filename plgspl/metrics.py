@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+
+# metrics are off unless enabled; the timers below then cost a single attribute check
+enabled = False
+stages = dict()
+chunks = []
+# pdfs are written on a background thread, which times its stages alongside the main thread
+lock = threading.Lock()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def record(stage, seconds, calls=1):
+    with lock:
+        s = stages.get(stage)
+        if s is None:
+            s = stages[stage] = {'seconds': 0.0, 'calls': 0}
+        s['seconds'] += seconds
+        s['calls'] += calls
+
+
+def record_chunk(path, size, pages, submissions, image_bytes_saved=0, questions=0, questions_reused=0):
+    '''
+        records an output pdf, the number of bytes written to it, the bytes saved by downscaling its images
+        and how many of its questions were copied from an identical one
+    '''
+    if enabled:
+        chunks.append({'path': path, 'bytes': size, 'pages': pages,
+                       'submissions': submissions, 'image_bytes_saved': image_bytes_saved,
+                       'questions': questions, 'questions_reused': questions_reused})
+
+
+class timed:
+    '''
+        a context manager that adds its wall time and a call to the given stage.
+        stages may nest, e.g. a question part is timed within its submission.
+    '''
+    __slots__ = ['stage', 'start']
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        if enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if enabled:
+            record(self.stage, time.perf_counter() - self.start)
+
+
+def collect() -> dict:
+    '''
+        returns and resets the metrics recorded in this process, so a worker can hand them back
+    '''
+    global stages, chunks
+    snapshot = {'stages': stages, 'chunks': chunks}
+    stages, chunks = dict(), []
+    return snapshot
+
+
+def init_worker(on):
+    '''
+        pool initializer. forked workers inherit the parent's metrics, which the parent already has.
+    '''
+    enable(on)
+    collect()
+
+
+def merge(snapshot):
+    '''
+        adds metrics collected in another process to this one
+    '''
+    for stage, s in snapshot['stages'].items():
+        record(stage, s['seconds'], s['calls'])
+    chunks.extend(snapshot['chunks'])
+
+
+def report() -> dict:
+    return {'stages': dict(sorted(stages.items())), 'chunks': sorted(chunks, key=lambda c: c['path'])}
+
+
+def dump(path):
+    json.dump(report(), open(path, 'w'), indent=2)
+
+
+def summary():
+    '''
+        prints the recorded stages, slowest first
+    '''
+    for stage, s in sorted(stages.items(), key=lambda i: -i[1]['seconds']):
+        print(f"{stage:>32}: {s['seconds']:9.3f}s {s['calls']:8d} call(s)")
+    if chunks:
+        print(f"{'pdf bytes written':>32}: {sum(c['bytes'] for c in chunks)} in {len(chunks)} pdf(s)")
+        print(f"{'image bytes saved':>32}: {sum(c['image_bytes_saved'] for c in chunks)}")
+        print(f"{'questions deduplicated':>32}: {sum(c['questions_reused'] for c in chunks)} "
+              f"of {sum(c['questions'] for c in chunks)}")
@@ -0,0 +1,223 @@
+import json
+import os
+import time
+from itertools import chain
+from plgspl.cfg import settings
+from plgspl.files import FileIndex
+from plgspl.types import PDF
+from plgspl import images
+from plgspl.content import LRUCache, digest
+from plgspl.metrics import timed
+from plgspl.to_pdf import parse_config, read_submissions, stream_submissions
+
+BUDGETS = ['default', 'file', 'string']
+
+# latin-1 character widths of each core font, so a string is measured without a python loop
+widths = dict()
+# where write_html leaves the page, by the html and where it started. identical uploads are laid out once.
+# entries are a handful of numbers, so the cache is bounded by count
+html_layouts = LRUCache(1 << 14, sizeof=lambda _: 1)
+
+
+class LayoutPDF(PDF):
+    '''
+        a pdf that lays out pages without producing any pdf content.
+        text is still measured with the real font metrics and images are sized from their headers,
+        so pages break where they would in a real render.
+        pages that run past their maxPages budget are recorded rather than ending the run or being truncated.
+    '''
+    truncate = False
+
+    def __init__(self):
+        super().__init__()
+        # (info, budget, pages needed) for every padded question, part or file, in render order
+        self.needs = []
+
+    def _out(self, s):
+        pass
+
+    def cell(self, w, h=0, txt='', border=0, ln=0, align='', fill=0, link=''):
+        # the cursor movement of FPDF.cell, which multi_cell and write lay their lines out with
+        if self.y + h > self.page_break_trigger and not self.in_footer and self.accept_page_break():
+            x = self.x
+            self.add_page(self.cur_orientation)
+            self.x = x
+        if w == 0:
+            w = self.w - self.r_margin - self.x
+        self.lasth = h
+        if ln > 0:
+            self.y += h
+            if ln == 1:
+                self.x = self.l_margin
+        else:
+            self.x += w
+
+    def text_width(self, s):
+        '''
+            returns the width of s in thousandths of the font size, as fpdf wraps text
+        '''
+        name = self.current_font['name']
+        table = widths.get(name)
+        if table is None:
+            cw = self.current_font['cw']
+            table = widths[name] = [cw.get(chr(i), 0) for i in range(256)]
+        return sum(map(table.__getitem__, s.encode('latin-1', 'ignore')))
+
+    def get_string_width(self, s):
+        if self.unifontsubset:
+            return super().get_string_width(s)
+        return self.text_width(self.normalize_text(s)) * self.font_size / 1000.0
+
+    def multi_cell(self, w, h, txt='', border=0, align='J', fill=0, split_only=False):
+        # most lines fit on one line, which is laid out as the one cell fpdf would give it
+        s = self.normalize_text(txt).replace('\r', '')
+        if s.endswith('\n'):
+            s = s[:-1]
+        if self.unifontsubset or split_only or '\n' in s:
+            return super().multi_cell(w, h, txt, border, align, fill, split_only)
+        if w == 0:
+            w = self.w - self.r_margin - self.x
+        if self.text_width(s) > (w - 2 * self.c_margin) * 1000.0 / self.font_size:
+            return super().multi_cell(w, h, txt, border, align, fill, split_only)
+        self.ws = 0
+        self.cell(w, h, ln=2)
+        self.x = self.l_margin
+        return []
+
+    def write(self, h, txt='', link=''):
+        # as with multi_cell, text that fits on the current line is a single cell
+        s = self.normalize_text(txt).replace('\r', '')
+        if self.unifontsubset or '\n' in s:
+            return super().write(h, txt, link)
+        l = self.text_width(s)
+        if l > (self.w - self.r_margin - self.x - 2 * self.c_margin) * 1000.0 / self.font_size:
+            return super().write(h, txt, link)
+        if s:
+            self.cell(l / 1000.0 * self.font_size, h)
+
+    def write_html(self, text, image_map=None):
+        key = (digest(text.encode('latin-1', 'replace')), self.x, self.y)
+        layout = html_layouts.get(key)
+        if layout is None:
+            page = self.page
+            super().write_html(text, image_map)
+            html_layouts.put(key, (self.page - page, self.x, self.y, self.lasth,
+                                   self.font_family, self.font_style + ('U' if self.underline else ''),
+                                   self.font_size_pt))
+            return
+        pages, x, y, lasth, family, style, size = layout
+        for _ in range(pages):
+            self.add_page(self.cur_orientation)
+        self.set_font(family, style, size)
+        self.x, self.y, self.lasth = x, y, lasth
+
+    def line(self, x1, y1, x2, y2):
+        pass
+
+    def set_line_width(self, width):
+        pass
+
+    def set_draw_color(self, r, g=-1, b=-1):
+        pass
+
+    def set_fill_color(self, r, g=-1, b=-1):
+        pass
+
+    def put_image(self, name, data: bytes, w=0, h=0):
+        size = images.dimensions(data)
+        if size is None:
+            return super().put_image(name, data, w, h)
+        width, height = size
+        if w == 0 and h == 0:
+            w, h = width / self.k, height / self.k
+        elif w == 0:
+            w = h * width / height
+        elif h == 0:
+            h = w * height / width
+        # mirrors the flowing layout of FPDF.image
+        if self.y + h > self.page_break_trigger and not self.in_footer and self.accept_page_break():
+            x = self.x
+            self.add_page(self.cur_orientation)
+            self.x = x
+        self.y += h
+
+    def check_pages(self, page_number, info='', budget=None):
+        if budget:
+            max_pages = getattr(settings, f'max_pages_{budget}')
+            self.needs.append(
+                (info, budget, self.page_no() - page_number + max_pages))
+
+
+def plan_submission(v, config, template_submission=None, is_template=False):
+    '''
+        lays out a submission, returning its pages and the pages each of its padded parts needs
+    '''
+    pdf = LayoutPDF()
+    v.render_submission(pdf, config, is_template, template_submission)
+    return pdf.page_no(), pdf.needs
+
+
+def plan_pdf(info_json, manual_csv, file_dir=None, stream=False):
+    '''
+        lays out every submission as plgspl pdf would, without writing any pdfs.
+        reports the submissions and parts that would run past their page budgets,
+        suggests maxPages values that fit the whole class, and writes the page needs
+        of every student to <title>_plan.json.
+    '''
+    begin = time.perf_counter()
+    out_file, config = parse_config(info_json)
+    file_index = FileIndex.load(
+        file_dir, config.questions.keys()) if file_dir else None
+    if stream:
+        students = stream_submissions(manual_csv, config, file_index)
+    else:
+        students = iter(read_submissions(
+            manual_csv, config, file_index).values())
+    template_submission = next(students, None)
+    if not template_submission:
+        print('No submissions to plan.')
+        return
+
+    with timed('plan.sample'):
+        expected_pages, _ = plan_submission(
+            template_submission, config, is_template=True)
+    current = {b: getattr(settings, f'max_pages_{b}') for b in BUDGETS}
+    # the most pages each budget needs, and the first part that needed them
+    worst = {b: (1, None) for b in BUDGETS}
+    report, over_sample, over_budget = [], [], []
+    with timed('plan.submissions'):
+        for i, v in enumerate(chain([template_submission], students)):
+            pages, needs = plan_submission(
+                v, config, template_submission if i != 0 else None)
+            report.append({'uid': v.uid, 'pages': pages, 'needs': needs})
+            if pages > expected_pages:
+                over_sample.append(v.uid)
+            for info, budget, n in needs:
+                if n > current[budget]:
+                    over_budget.append((v.uid, info, budget, n))
+                if n > worst[budget][0]:
+                    worst[budget] = (n, f'{v.uid}, {info}')
+    elapsed = time.perf_counter() - begin
+
+    print(f'Planned {len(report)} submission(s) in {elapsed:.2f}s. The sample is {expected_pages} page(s).')
+    if over_budget:
+        outcome = 'be truncated' if settings.truncate_overflow else 'stop plgspl pdf'
+        print(f'{len(over_budget)} part(s) run past maxPages and would {outcome}:')
+        for uid, info, budget, n in over_budget[:20]:
+            print(f'  {uid}, {info}: {n} pages, maxPages.{budget} is {current[budget]}')
+        if len(over_budget) > 20:
+            print(f'  ... and {len(over_budget) - 20} more, see {out_file}_plan.json')
+    if over_sample:
+        print(f'{len(over_sample)} submission(s) run past the sample template:', over_sample[:20])
+    if not (over_budget or over_sample):
+        print('Every submission fits in its page budget.')
+    print('Suggested maxPages:')
+    for b in BUDGETS:
+        n, by = worst[b]
+        print(f'  {b}: {n} (now {current[b]})' + (f', needed by {by}' if by else ''))
+
+    path = os.path.join(os.getcwd(), f'{out_file}_plan.json')
+    json.dump({'expected_pages': expected_pages, 'max_pages': current,
+               'suggested_max_pages': {b: n for b, (n, _) in worst.items()},
+               'students': report}, open(path, 'w'))
+    print(f'Wrote {path}')
@@ -6,9 +6,12 @@ __version__ = "0.0.0"
 import sys
 import os
 import json
-from plgspl.to_pdf import to_pdf
-from plgspl.classlist import classlist
-from plgspl.merge import merge
+import cProfile
+import plgspl.metrics as metrics
+from plgspl.files import is_zip
+from plgspl.qmap import QMAP_FORMATS, convert
+from plgspl.shard import Shard, combine
+# each command imports what it runs, so e.g. classlist doesn't load fpdf or read the defaults
 
 
 def append_cwd(s):
@@ -22,21 +25,102 @@ def validate_files(l):
             sys.exit(1)
 
 
+def pop_flag(args, name):
+    '''
+        removes "--name" from the given argument list. returns whether it was present.
+    '''
+    flag = f'--{name}'
+    if flag not in args:
+        return False
+    args.remove(flag)
+    return True
+
+
+def pop_option(args, name, default=None, cast=str):
+    '''
+        removes "--name value" from the given argument list and returns the cast value.
+        returns the default if the option was not given.
+    '''
+    flag = f'--{name}'
+    if flag not in args:
+        return default
+    i = args.index(flag)
+    if i + 1 >= len(args):
+        print("Missing a value for %s" % flag)
+        sys.exit(1)
+    value = args[i + 1]
+    del args[i:i + 2]
+    try:
+        return cast(value)
+    except ValueError:
+        print("Invalid value for %s: %s" % (flag, value))
+        sys.exit(1)
+
+
+def pop_qmap_format(args):
+    qmap_format = pop_option(args, 'qmap', default='json')
+    if qmap_format not in QMAP_FORMATS:
+        print("Unsupported qmap format: %s" % qmap_format)
+        sys.exit(1)
+    return qmap_format
+
+
 def main():
     print("Running plgspl version %s..." % __version__)
     print("List of argument strings: %s" % sys.argv[1:])
+    args = sys.argv[1:]
+    metrics_json = pop_option(args, 'metrics')
+    profile_out = pop_option(args, 'profile')
+    sys.argv[1:] = args
+    if not (metrics_json or profile_out):
+        run()
+        return
+
+    metrics.enable()
+    profiler = cProfile.Profile() if profile_out else None
+    with metrics.timed(f'command.{args[0]}'):
+        if profiler:
+            profiler.runcall(run)
+        else:
+            run()
+    if profiler:
+        profiler.dump_stats(append_cwd(profile_out))
+        print(f'Wrote profile to {profile_out}')
+    if metrics_json:
+        metrics.dump(append_cwd(metrics_json))
+        print(f'Wrote metrics to {metrics_json}')
+    metrics.summary()
+
+
+def run():
     cmd = sys.argv[1]
     if cmd == 'pdf':
-        args = list(map(append_cwd, sys.argv[2:]))
+        args = sys.argv[2:]
+        workers = pop_option(args, 'workers', default=1, cast=int)
+        stream = pop_flag(args, 'stream')
+        plan = pop_flag(args, 'plan')
+        resume = pop_flag(args, 'resume')
+        cache_dir = pop_option(args, 'cache')
+        qmap_format = pop_qmap_format(args)
+        shard = pop_option(args, 'shard', cast=Shard.parse)
+        args = list(map(append_cwd, args))
         validate_files(args[0:1])
         file_dir = args[2] if len(args) == 3 else None
-        if file_dir and not os.path.isdir(file_dir):
+        if file_dir and not (os.path.isdir(file_dir) or is_zip(file_dir)):
             print("Unable to find the given file directory: %s" % file_dir)
             sys.exit(1)
-        to_pdf(args[0], args[1], file_dir)
+        if plan:
+            from plgspl.plan import plan_pdf
+            plan_pdf(args[0], args[1], file_dir, stream)
+            return
+        from plgspl.to_pdf import to_pdf
+        to_pdf(args[0], args[1], file_dir, workers=workers, stream=stream,
+               cache_dir=append_cwd(cache_dir) if cache_dir else None, qmap_format=qmap_format, shard=shard,
+               resume=resume)
     elif cmd == "classlist":
         f = sys.argv[2]
         validate_files([f])
+        from plgspl.classlist import classlist
         classlist(f)
     elif cmd == "merge":
         args = sys.argv[2:]
@@ -44,4 +128,38 @@ def main():
         instance = 1
         if len(args) > 2 :
             instance = int(args[2])
+        from plgspl.merge import merge
         merge(args[0], args[1], instance)
+    elif cmd == "combine":
+        args = sys.argv[2:]
+        qmap_format = pop_qmap_format(args)
+        args = list(map(append_cwd, args))
+        validate_files(args)
+        if len(args) == 0:
+            print("Usage: plgspl combine <SHARD_JSON>...")
+            sys.exit(1)
+        combine(args, qmap_format)
+    elif cmd == "batch":
+        args = sys.argv[2:]
+        workers = pop_option(args, 'workers', cast=int)
+        summary_json = pop_option(args, 'out')
+        if len(args) != 1:
+            print("Usage: plgspl batch <MANIFEST_JSON> [--workers N] [--out SUMMARY_JSON]")
+            sys.exit(1)
+        manifest_json = append_cwd(args[0])
+        validate_files([manifest_json])
+        if not summary_json:
+            summary_json = f'{os.path.splitext(os.path.basename(manifest_json))[0]}_summary.json'
+        from plgspl.batch import batch
+        batch(manifest_json, append_cwd(summary_json), workers)
+    elif cmd == "serve":
+        args = sys.argv[2:]
+        port = pop_option(args, 'port', default=8765, cast=int)
+        workers = pop_option(args, 'workers', default=1, cast=int)
+        from plgspl.serve import serve
+        # a portal that starts the daemon may choose its token, rather than read it from the output
+        serve(port, workers, os.environ.get('PLGSPL_TOKEN'))
+    elif cmd == "qmap":
+        args = list(map(append_cwd, sys.argv[2:]))
+        validate_files(args[0:1])
+        convert(args[0], args[1] if len(args) > 1 else None)
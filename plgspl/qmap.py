@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Tuple
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+QMAP_FORMATS = ['json', 'sqlite']
+
+
+def is_sqlite(path) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def write_qmap(path, qmap: Iterable[Tuple[str, List[list]]], pdfs: Dict[str, str] = None):
+    '''
+        writes (uid, questions) pairs as a sqlite qmap, where questions are the
+        [variant, partial scores json] pairs from Submission.list_questions.
+        pdfs gives the output pdf each student is in, when the qmap came from plgspl pdf.
+        one row is stored per student question, so a reader only touches the students it looks up.
+    '''
+    if os.path.exists(path):
+        os.remove(path)
+    db = sqlite3.connect(path)
+    with db:
+        db.execute('CREATE TABLE students (uid TEXT PRIMARY KEY, chunk TEXT) WITHOUT ROWID')
+        db.execute('''CREATE TABLE questions (uid TEXT NOT NULL, position INTEGER NOT NULL,
+                      variant TEXT NOT NULL, partial_scores TEXT NOT NULL,
+                      PRIMARY KEY (uid, position)) WITHOUT ROWID''')
+        for uid, questions in qmap:
+            db.execute('INSERT INTO students VALUES (?, ?)', (uid, pdfs.get(uid) if pdfs else None))
+            db.executemany('INSERT INTO questions VALUES (?, ?, ?, ?)',
+                           ((uid, i, q[0], q[1]) for i, q in enumerate(questions)))
+    db.close()
+
+
+class QMap():
+    '''
+        a read only view over a sqlite qmap. looks like the json qmap dict,
+        but each student's questions are only read when they are looked up.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        # qmaps converted before chunks were recorded have no chunk column
+        self.chunks = any(r[1] == 'chunk' for r in self.db.execute('PRAGMA table_info(students)'))
+
+    def __getitem__(self, uid) -> List[list]:
+        rows = self.db.execute(
+            'SELECT variant, partial_scores FROM questions WHERE uid = ? ORDER BY position', (uid,)).fetchall()
+        if not rows and uid not in self:
+            raise KeyError(uid)
+        return [list(r) for r in rows]
+
+    def chunk(self, uid):
+        '''
+            returns the output pdf the student is in, if it was recorded
+        '''
+        row = self.db.execute('SELECT chunk FROM students WHERE uid = ?', (uid,)).fetchone() if self.chunks else None
+        return row[0] if row else None
+
+    def __contains__(self, uid) -> bool:
+        return self.db.execute('SELECT 1 FROM students WHERE uid = ?', (uid,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.db.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+
+    def keys(self) -> List[str]:
+        return [r[0] for r in self.db.execute('SELECT uid FROM students')]
+
+    def items(self):
+        for uid in self.keys():
+            yield uid, self[uid]
+
+    def close(self):
+        self.db.close()
+
+
+def load_qmap(path) -> Dict[str, List[list]]:
+    '''
+        opens either a json or a sqlite qmap
+    '''
+    if is_sqlite(path):
+        return QMap(path)
+    return json.load(open(path))
+
+
+def qmap_path(out_file, fmt='json'):
+    return f"{out_file}_qmap.{'db' if fmt == 'sqlite' else 'json'}"
+
+
+def pdfs_path(out_file):
+    return f'{out_file}_pdfs.json'
+
+
+def save_qmap(out_file, qmap: Dict[str, List[list]], fmt='json', pdfs: Dict[str, str] = None):
+    '''
+        writes the qmap of a pdf run, and which output pdf each student is in.
+        a sqlite qmap keeps the pdfs in its students table, and a json qmap keeps them alongside it
+        in <out_file>_pdfs.json, leaving each student's question entries as they were.
+    '''
+    if fmt == 'sqlite':
+        write_qmap(qmap_path(out_file, fmt), qmap.items(), pdfs)
+        return
+    json.dump(qmap, open(qmap_path(out_file, fmt), 'w'))
+    if pdfs:
+        json.dump(pdfs, open(pdfs_path(out_file), 'w'))
+
+
+def write_overflow(out_file, truncated):
+    '''
+        writes the overflow report, listing each part that was truncated to its page budget by student
+    '''
+    path = f'{out_file}_overflow.json'
+    json.dump([{'uid': uid, 'part': part} for uid, part in truncated], open(path, 'w'))
+    print(f'Wrote {path}')
+
+
+def convert(qmap_json, out_path=None):
+    '''
+        converts a json qmap into a sqlite qmap, next to it unless an out path is given
+    '''
+    out_path = out_path or os.path.splitext(qmap_json)[0] + '.db'
+    # the pdfs each student is in, if they were written alongside the qmap
+    pdfs = pdfs_path(qmap_json[:-len('_qmap.json')]) if qmap_json.endswith('_qmap.json') else None
+    pdfs = json.load(open(pdfs)) if pdfs and os.path.isfile(pdfs) else None
+    write_qmap(out_path, json.load(open(qmap_json)).items(), pdfs)
+    print(f'Wrote {out_path}')
+    return out_path
@@ -2,30 +2,34 @@ from plgspl.types import PDF
 from enum import Enum
 from functools import reduce
 from typing import List, Dict
+import io
 import json
 import os
 import re
 import collections
-from plgspl.cfg import cfg, get_cfg
+from plgspl.cfg import Font, settings
+from plgspl.metrics import timed
+from plgspl.files import parse_filename, open_file, file_digest, ZipSource
+from plgspl.content import digest, markdown_cache
 import markdown2
 from unidecode import unidecode
 
-lineWidth = get_cfg('page', 'lineWidth', default=180, cast=int)
-lineHeight = get_cfg('page', 'lineHeight', default=0, cast=int)
+lineWidth = settings.line_width
+lineHeight = settings.line_height
 
 
 def to_latin1(s: str) -> str:
     return unidecode(s)
 
 
-def draw_line(pdf: PDF, width=lineWidth, color=get_cfg('font', 'header', 'line', default={"r": 0, "b": 0, "g": 0})):
+def draw_line(pdf: PDF, width=lineWidth, color=settings.header_font.line):
     '''
         draws a line on the page.
         by default, the line is the page width.
     '''
     pdf.ln(6)
     pdf.set_line_width(0.5)
-    pdf.set_draw_color(color['r'], color['b'], color['g'])
+    pdf.set_draw_color(color.r, color.b, color.g)
     pdf.line(10, pdf.get_y(), 12 + width, pdf.get_y())
     pdf.ln(6)
 
@@ -35,37 +39,42 @@ def pad(pdf):
         pads the pdf with a blank page.
     '''
     pdf.add_page()
+    pdf.stamp('pad', lambda: draw_blank(pdf))
+
+
+def draw_blank(pdf):
     draw_line(pdf)
     pdf.cell(lineWidth, txt="This is a blank page.")
 
 
-def pad_until(pdf: PDF, page_number, info=''):
+def pad_until(pdf: PDF, page_number, info='', budget=None):
     '''
         pads the pdf until the target page number.
+        budget names the maxPages setting the target comes from, see PDF.check_pages.
     '''
-    if pdf.page_no() > page_number:
-        print('Warning: A question exceeds expected length. Please re-adjust your configuration.', info)
-        print('Dumping current pdf as incomplete_assignment.pdf')
-        pdf.output(os.path.join(os.getcwd(), 'incomplete_assignment.pdf'))
-        exit(1)
+    pdf.check_pages(page_number, info, budget)
     while pdf.page_no() < page_number:
         pad(pdf)
 
 
-def render_header(pdf: PDF, txt, header_cfg=get_cfg('font', 'header')):
+def render_header(pdf: PDF, txt, header_font: Font = settings.header_font):
     '''
         renders a question header with the given text.
     '''
-    pdf.set_font(header_cfg['font'], size=header_cfg['size'])
+    pdf.stamp(('header', txt, header_font), lambda: draw_header(pdf, txt, header_font))
+
+
+def draw_header(pdf: PDF, txt, header_font: Font):
+    pdf.set_font(header_font.font, size=header_font.size)
     pdf.cell(lineWidth, txt=txt)
-    draw_line(pdf, pdf.get_string_width(txt), header_cfg['line'])
+    draw_line(pdf, pdf.get_string_width(txt), header_font.line)
 
 
 def render_part_header(pdf: PDF, txt):
     '''
         renders a part header with the given text.
     '''
-    render_header(pdf, txt, header_cfg=get_cfg('font', 'subheader'))
+    render_header(pdf, txt, header_font=settings.subheader_font)
 
 
 def render_gs_anchor(pdf: PDF, variant, score=0):
@@ -77,43 +86,26 @@ def render_gs_anchor(pdf: PDF, variant, score=0):
           1: Completely correct answer.
     '''
     if score == -1:
-        a_cfg = get_cfg('gsAnchor', 'blank')
+        anchor = settings.blank_anchor
     elif score == 0:
-        a_cfg = get_cfg('gsAnchor', 'incorrect')
+        anchor = settings.incorrect_anchor
     elif score < 1:
-        a_cfg = get_cfg('gsAnchor', 'partial')
+        anchor = settings.partial_anchor
     elif score == 1:
-        a_cfg = get_cfg('gsAnchor', 'correct')
+        anchor = settings.correct_anchor
     else:
         return
-    fill = a_cfg['fill']
-    text = f'{a_cfg["text"]}: {score}' if score > -1 else a_cfg['text']
-    pdf.set_font(cfg['font']['body']['font'])
-    pdf.set_fill_color(fill['r'], fill['g'], fill['b'])
+    fill = anchor.fill
+    text = f'{anchor.text}: {score}' if score > -1 else anchor.text
+    pdf.set_font(settings.body_font.font)
+    pdf.set_fill_color(fill.r, fill.g, fill.b)
     pdf.cell(lineWidth,
-             h=get_cfg('gsAnchor', 'height'),
+             h=settings.anchor_height,
              txt=text,
              fill=True)
     pdf.ln()
 
 
-def escape_qid(qid):
-    '''
-        Replaces all "special" characters in the qid that should be underscores in the db
-    '''
-    return qid.replace("/", "_")
-
-
-def parse_filename(raw: str, qid):
-    '''
-        parses a pl filename, assuming it belongs to a question
-        with the given question id.
-    '''
-    parsed = raw.rsplit(escape_qid(qid) + "_",
-                        1).pop().split("_", 1).pop()
-    return parsed
-
-
 class QuestionInfo():
     '''
         encapsulates the general question information for a pl question
@@ -124,17 +116,25 @@ class QuestionInfo():
                  number: int,
                  variants: List[str] = False,
                  parts: List[str] = False,
-                 expected_files: set = False,
-                 number_choose: int = 1):
+                 expected_files: List[str] = False,
+                 number_choose: int = 1,
+                 part_kinds: Dict[str, str] = False):
         self.qid = qid
         self.number = number
-        self.expected_files = expected_files or set()
+        self.expected_files = list(expected_files or [])
         self.parts = parts or []
         self.number_choose = number_choose
         self.variants = variants or [qid]
+        # the kind of each part, declared in the config or learnt from the first answer that has it.
+        # see StudentQuestion.get_question_parts
+        self.part_kinds = dict(part_kinds or {})
+        # the unsupported parts that have been skipped, so each is only reported once
+        self.skipped = set()
 
-    def add_file(self, filename):
-        self.expected_files.add(parse_filename(filename, self.qid))
+    def add_file(self, filename, variant=None):
+        name = parse_filename(filename, variant or self.qid)
+        if name not in self.expected_files:
+            self.expected_files.append(name)
 
     def is_part(self, part_name: str):
         return len(self.parts) == 0 or part_name.upper() in self.parts
@@ -174,11 +174,14 @@ class AssignmentConfig:
 class StudentFileBundle():
     '''
         manages and provides utility functions for a "file bundle",
-        i.e. a set of absolute file paths for pl student file uploads
+        i.e. a set of absolute file paths for pl student file uploads,
+        or member names if the uploads are read from a zip source
     '''
+    __slots__ = ['files', 'source']
 
-    def __init__(self, paths: List[str] = [], qid=""):
+    def __init__(self, paths: List[str] = [], qid="", source: ZipSource = None):
         self.files = dict()
+        self.source = source
         for path in paths:
             self.add_file(qid, path)
 
@@ -186,8 +189,8 @@ class StudentFileBundle():
         self.files[parse_filename(path, qid)] = path
 
     def pad_from(self, pdf, start, filename):
-        pad_until(pdf, start + get_cfg('maxPages', 'file', cast=int, default=1) - 1,
-                  f'padding for file {filename}')
+        pad_until(pdf, start + settings.max_pages_file - 1,
+                  f'padding for file {filename}', 'file')
 
     def render_file(self, pdf: PDF, filename, blank=False):
         '''
@@ -200,33 +203,55 @@ class StudentFileBundle():
 
         if path:
             start = pdf.page_no()
-            ext = os.path.splitext(path)[1][1:]
-            font = get_cfg('font', 'code') if ext in get_cfg(
-                'files', 'code') else get_cfg('font', 'body')
-            pdf.set_font(font['font'], size=font['size'])
-            if blank:
-                pdf.cell(lineWidth, txt="This is a sample student answer.")
-            elif ext in get_cfg('files', 'md'):
-                pdf.write_html(to_latin1(markdown2.markdown_path(path)))
-            elif ext in get_cfg('files', 'pics'):
-                pdf.image(path, w=lineWidth)
-            else:
-                for line in open(path, 'r'):
-                    pdf.multi_cell(lineWidth, lineHeight, txt=to_latin1(line))
+            pdf.clip(start + settings.max_pages_file - 1, f'file {filename}',
+                     lambda: self.render_contents(pdf, path, blank))
         self.pad_from(pdf, start, filename)
 
+    def render_contents(self, pdf: PDF, path, blank=False):
+        '''
+            renders the contents of the file at path, by its extension
+        '''
+        ext = os.path.splitext(path)[1][1:]
+        font = settings.code_font if ext in settings.code_exts else settings.body_font
+        pdf.set_font(font.font, size=font.size)
+        if blank:
+            pdf.cell(lineWidth, txt="This is a sample student answer.")
+        elif ext in settings.md_exts:
+            with timed('render.markdown'):
+                with open_file(path, self.source) as f:
+                    data = f.read()
+                key = digest(data)
+                html = markdown_cache.get(key)
+                if html is None:
+                    html = to_latin1(markdown2.markdown(data.decode('utf-8')))
+                    markdown_cache.put(key, html)
+                pdf.write_html(html)
+        elif ext in settings.pic_exts:
+            with timed('render.image'):
+                with open_file(path, self.source) as f:
+                    pdf.put_image(path, f.read(), w=lineWidth)
+        else:
+            with timed('render.code'), io.TextIOWrapper(open_file(path, self.source)) as f:
+                for line in f:
+                    pdf.multi_cell(lineWidth, lineHeight,
+                                   txt=to_latin1(line))
+
 
 class QuestionPart():
     '''
         encapsulates a part of a question.
     '''
+    __slots__ = ['question_number', 'part', 'key', 'score', 'max_pages']
+
+    # the maxPages setting the part is padded to
+    budget = 'default'
 
     def __init__(self, question_number: int, part: int, key, score: int = 0, weight: int = 1):
         self.question_number = question_number
         self.part = part
         self.key = key
         self.score = score
-        self.max_pages = get_cfg('maxPages', 'default', cast=int, default=1)
+        self.max_pages = settings.max_pages_default
 
     def render_ctx(self, pdf: PDF):
         '''
@@ -267,37 +292,68 @@ class QuestionPart():
 
             if as_template is true, will not render answer, and anchor will be empty.
         """
+        with timed(f'render.{type(self).__name__}'):
+            self.render_part(pdf, as_template)
+
+    def render_part(self, pdf: PDF, as_template=False):
         start = pdf.page_no()
-        render_part_header(
-            pdf, f'Question {self.question_number}.{self.part}: {self.key}')
-        pdf.set_font(get_cfg('font', 'body', 'font', default='arial'),
-                     size=get_cfg('font', 'body', 'font', cast=int, default=10))
-        # self.render_ctx(pdf)
-        draw_line(pdf)
-        render_gs_anchor(pdf, self.key, -1 if as_template else self.score)
-        draw_line(pdf)
-        self.render_expected(pdf)
+        end = start + self.max_pages - 1
+        info = f'question {self.question_number}.{self.part}'
+        if self.budget:
+            pdf.clip(end, info, lambda: self.render_body(pdf, as_template))
+        else:
+            self.render_body(pdf, as_template)
+        pad_until(pdf, end, f'padding for {info}', self.budget)
+
+    def expected_key(self):
+        '''
+            returns what render_expected draws from, so parts with the same expected answer can share a form.
+            None if it can't be told, and the expected answer is drawn as is.
+        '''
+        return type(self).render_expected is QuestionPart.render_expected or None
+
+    def render_body(self, pdf: PDF, as_template=False):
+        title = f'Question {self.question_number}.{self.part}: {self.key}'
+        score = -1 if as_template else self.score
+        # the header and anchor only depend on the part and its score
+        pdf.stamp(('part', title, score), lambda: self.render_head(pdf, title, score))
+        expected = self.expected_key()
+        if expected is None:
+            self.render_expected(pdf)
+        else:
+            pdf.stamp(('expected', type(self), expected),
+                      lambda: self.render_expected(pdf))
         draw_line(pdf)
         self.render_ans(
             pdf) if not as_template else self.render_template_ans(pdf)
-        pad_until(pdf, start + self.max_pages - 1,
-                  f'padding for question {self.question_number}.{self.part}')
+
+    def render_head(self, pdf: PDF, title, score):
+        render_part_header(pdf, title)
+        pdf.set_font(settings.body_font.font, size=settings.body_font.size)
+        # self.render_ctx(pdf)
+        draw_line(pdf)
+        render_gs_anchor(pdf, self.key, score)
+        draw_line(pdf)
 
 
 class FileQuestionPart(QuestionPart):
     '''
         a file question part. may include multiple files.
     '''
+    __slots__ = ['files', 'file_bundle']
+
+    # each file is held to maxPages.file by its bundle
+    budget = None
 
     def __init__(self, question_number: int, part: int, key, score: int = 0, weight: int = 1, files=[], file_bundle=None):
         super().__init__(question_number, part, key, score, weight)
         self.files = files
         self.file_bundle = file_bundle
-        self.max_pages = get_cfg("maxPages", "file",
-                                 cast=int, default=1) * len(files)
+        self.max_pages = settings.max_pages_file * len(files)
 
     def render_ctx(self, pdf): pass
     def render_expected(self, pdf): pass
+    def expected_key(self): return True
 
     def render_ans_helper(self, pdf: PDF, template=False):
         if self.file_bundle:
@@ -318,13 +374,16 @@ class StringQuestionPart(QuestionPart):
     '''
         a string question part. can be a short answer or longform text from a text box.
     '''
+    __slots__ = ['ans', 'ctx', 'true_ans']
+
+    budget = 'string'
 
     def __init__(self, question_number: int, part: int, key, score: int = 0, weight: int = 1, ctx='', true_ans='', ans=''):
         super().__init__(question_number, part, key, score, weight)
         self.ans = str(ans)
         self.ctx = ctx
         self.true_ans = str(true_ans)
-        self.max_pages = get_cfg('maxPages', 'string', cast=int, default=1)
+        self.max_pages = settings.max_pages_string
 
     def render_ctx(self, pdf: PDF):
         if isinstance(self.ctx, str):
@@ -338,6 +397,9 @@ class StringQuestionPart(QuestionPart):
     def render_expected(self, pdf):
         pdf.multi_cell(lineWidth, lineHeight, txt=f'Expected: {self.true_ans}')
 
+    def expected_key(self):
+        return self.true_ans
+
     def render_ans(self, pdf: PDF):
         pdf.multi_cell(lineWidth, lineHeight, to_latin1(self.ans))
 
@@ -350,6 +412,7 @@ class MCQuestionPart(QuestionPart):
         choice parts in your question. this class was intended as an initial POC for what a question part
         might look like, and how HTML might render on PDFS
     '''
+    __slots__ = ['ans', 'ctx', 'true_ans']
 
     def __init__(self, question_number: int, part: int, key, score: int = 0, weight: int = 1, ctx=[], true_ans=[], ans=[]):
         super().__init__(question_number, part, key, score, weight)
@@ -382,6 +445,8 @@ class MCQuestionPart(QuestionPart):
 
 
 class ArrayQuestionPart(QuestionPart):
+    __slots__ = ['ans', 'true_ans']
+
     def __init__(self, question_number: int, part: int, key, score: int = 0, weight: int = 1, true_ans=[], ans=[]):
         super().__init__(question_number, part, key, score, weight)
         self.ans = ans
@@ -390,11 +455,16 @@ class ArrayQuestionPart(QuestionPart):
     def render_expected(self, pdf):
         pdf.multi_cell(lineWidth, lineHeight, txt=str(self.true_ans))
 
+    def expected_key(self):
+        return str(self.true_ans)
+
     def render_ans(self, pdf):
         pdf.multi_cell(lineWidth, lineHeight, txt=str(self.ans))
 
 
 class SymbolicQuestionPart(QuestionPart):
+    __slots__ = ['val', 'vars']
+
     def __init__(self, question_number, part, key, score: int = 0, weight: int = 1, ans_value="", ans_vars=[]):
         super().__init__(question_number, part, key, score, weight)
         self.val = ans_value
@@ -406,7 +476,56 @@ class SymbolicQuestionPart(QuestionPart):
         pdf.cell(lineWidth, lineHeight, txt=f'Variables: {self.vars}')
 
 
+def part_kind(p, v, ans_key: dict, params: dict):
+    '''
+        returns the kind of question part a student answer decodes to, or None if it's unsupported.
+        a missing answer is a "blank" part.
+    '''
+    if v is None:
+        return 'blank'
+    elif p.find('res') == 0 and isinstance(ans_key.get(p, False), list) and isinstance(params.get(p, False), list):
+        return 'mc'
+    elif isinstance(v, list):
+        return 'array'
+    elif isinstance(v, dict) and v.get("_type", "") == "sympy":
+        return 'sympy'
+    elif isinstance(v, dict) and v.get("_type", "") == "ndarray":
+        return 'ndarray'
+    elif not isinstance(v, (dict, list)):
+        return 'string'
+    return None
+
+
+# cheap checks that an answer still decodes to a known part kind.
+# multiple choice depends on the answer key and params too, so "res" parts always go through part_kind.
+PART_GUARDS = {
+    'array': lambda v: isinstance(v, list),
+    'sympy': lambda v: isinstance(v, dict) and v.get("_type", "") == "sympy",
+    'ndarray': lambda v: isinstance(v, dict) and v.get("_type", "") == "ndarray",
+    'string': lambda v: v is not None and not isinstance(v, (dict, list)),
+}
+PART_KINDS = list(PART_GUARDS) + ['mc']
+
+PART_BUILDERS = {
+    'blank': lambda q_no, part_no, p, s, w, v, params, ans_key: StringQuestionPart(
+        q_no, part_no, p, s, w, params.get(p, ""), ans_key.get(p, ""), "No answer provided."),
+    'mc': lambda q_no, part_no, p, s, w, v, params, ans_key: MCQuestionPart(
+        q_no, part_no, p, s, w, params.get(p, []), ans_key.get(p, []), v),
+    'array': lambda q_no, part_no, p, s, w, v, params, ans_key: ArrayQuestionPart(
+        q_no, part_no, p, s, w, ans_key.get(p, []), v),
+    'sympy': lambda q_no, part_no, p, s, w, v, params, ans_key: SymbolicQuestionPart(
+        q_no, part_no, p, s, w, v["_value"], v["_variables"]),
+    'ndarray': lambda q_no, part_no, p, s, w, v, params, ans_key: ArrayQuestionPart(
+        q_no, part_no, p, s, w, ans_key.get(p, {}).get('_value', [[]])[0], v.get('_value', [[]])[0]),
+    'string': lambda q_no, part_no, p, s, w, v, params, ans_key: StringQuestionPart(
+        q_no, part_no, p, s, w, params.get(p, params), ans_key.get(p, ""), v),
+}
+
+
 class StudentQuestion:
+    __slots__ = ['question', 'file_bundle', 'variant', 'raw_params', 'raw_ans_key', 'raw_student_answer',
+                 'raw_partial_scores', 'file_names', 'digest', 'file_digests']
+
     def __init__(self, q: QuestionInfo,
                  raw_params: str, raw_ans_key: str, raw_student_answer: str, raw_partial_scores: str,
                  file_bundle: StudentFileBundle,
@@ -421,20 +540,43 @@ class StudentQuestion:
         self.question = q
         self.file_bundle = file_bundle
         self.variant = variant if variant else q.qid
+        # the csv columns are kept as raw json, and only decoded when they're asked for
+        self.raw_params = raw_params
+        self.raw_ans_key = raw_ans_key
+        self.raw_student_answer = raw_student_answer
+        self.raw_partial_scores = raw_partial_scores
+        # the files found so far, as the question picks up more of them while the csv is read
+        self.file_names = list(q.expected_files or (self.params.get('_required_file_names', [])
+                                                    if '_required_file_names' in raw_params else []))
+        # students who gave the same answers render the same pages, see content_key
+        self.digest = digest(json.dumps([self.variant, str(raw_params), str(raw_ans_key),
+                                         str(raw_student_answer), str(raw_partial_scores)]).encode())
+        self.file_digests = None
+
+    @property
+    def params(self) -> dict:
+        return json.loads(self.raw_params)
+
+    @property
+    def score(self) -> dict:
         try:
-            self.score = json.loads(raw_partial_scores)
+            return json.loads(self.raw_partial_scores)
         except TypeError:
-            self.score = {}
-
-        self.params = json.loads(raw_params)
-        ans_key = json.loads(raw_ans_key)
-        self.part_count = len(q.parts) + len(q.expected_files)
-        self.max_parts = len(q.expected_files) + len(ans_key)
-        self.parts = self.get_question_parts(
-            self.params,
-            ans_key,
-            json.loads(raw_student_answer),
-            self.score)
+            return {}
+
+    @property
+    def parts(self) -> list:
+        '''
+            the question's parts, decoded from the raw csv columns each time they're asked for,
+            so a submission waiting to be rendered doesn't hold onto them
+        '''
+        with timed('parse.json'):
+            params = self.params
+            score = self.score
+            ans_key = json.loads(self.raw_ans_key)
+            student_answer = json.loads(self.raw_student_answer)
+        with timed('parse.parts'):
+            return self.get_question_parts(params, ans_key, student_answer, score)
 
     def get_question_parts(self, params: dict(), ans_key: dict(), student_answer: dict(), partial_scores: dict()):
         '''
@@ -448,46 +590,34 @@ class StudentQuestion:
             hence, if the key doesn't exist on partial_scores, then we assign the question part a score of 0.
 
             as files do not exist on partial_scores, we assign all associated files (i.e. those uploaded through file editor) a score of 0
+
+            each part's kind is checked against the kind the question has seen for it before, and is only
+            worked out from scratch when it's new or doesn't match.
         '''
-        expected_parts = list(self.question.parts if len(
-            self.question.parts) > 0 else partial_scores.keys())
+        expected_parts = self.question.parts if len(
+            self.question.parts) > 0 else partial_scores.keys()
+        kinds = self.question.part_kinds
         parts = []
         q_no = self.question.number
-        while len(expected_parts) > 0:
-            p = expected_parts.pop(0)
+        for p in expected_parts:
             v = student_answer.get(p, None)
             score = partial_scores.get(p, None)
             s = int(score.get('score', 0)) if score else 0
             w = int(score.get('weight', 1)) if score else 0
-            part_no = len(parts) + 1
-            if v is None:
-                v = "No answer provided."
-                part = StringQuestionPart(q_no, part_no, p, s, w,
-                                          params.get(p, ""), ans_key.get(p, ""), v)
-            elif p.find('res') == 0 and isinstance(ans_key.get(p, False), list) and isinstance(params.get(p, False), list):
-                part = MCQuestionPart(q_no, part_no, p, s, w,
-                                      params.get(p, []), ans_key.get(p, []), v)
-            elif isinstance(v, list):
-                part = ArrayQuestionPart(q_no, part_no, p, s, w,
-                                         ans_key.get(p, []), v)
-            elif isinstance(v, dict) and v.get("_type", "") == "sympy":
-                part = SymbolicQuestionPart(q_no, part_no, p, s, w,
-                                            v["_value"], v["_variables"])
-            elif isinstance(v, dict) and v.get("_type", "") == "ndarray":
-                part = ArrayQuestionPart(q_no, part_no, p, s, w,
-                                         ans_key.get(p, {}).get(
-                                             '_value', [[]])[0],
-                                         v.get('_value', [[]])[0])
-            elif not isinstance(v, (dict, list)):
-                part = StringQuestionPart(q_no, part_no, p, s, w,
-                                          params.get(p, params), ans_key.get(p, ""), v)
-            else:
-                print("Skipping unsupported question part:", p, json.dumps(v))
+            kind = kinds.get(p)
+            if kind is None or kind == 'mc' or not PART_GUARDS[kind](v):
+                kind = part_kind(p, v, ans_key, params)
+                if kind in PART_GUARDS and p not in kinds and p.find('res') != 0:
+                    kinds[p] = kind
+            if kind is None:
+                if p not in self.question.skipped:
+                    self.question.skipped.add(p)
+                    print("Skipping unsupported question part:", p, json.dumps(v))
                 continue
-            parts.append(part)
+            parts.append(PART_BUILDERS[kind](
+                q_no, len(parts) + 1, p, s, w, v, params, ans_key))
 
-        file_names = list(self.question.expected_files or params.get(
-            '_required_file_names', []))
+        file_names = self.file_names
         if len(file_names) > 0:
             '''
                 create a file for each editor/upload file.
@@ -506,13 +636,27 @@ class StudentQuestion:
         '''
         return 0
 
+    def content_key(self, template=False):
+        '''
+            returns a key of everything the question's pages are drawn from:
+            its csv columns, the files it expects and their contents
+        '''
+        if self.file_digests is None:
+            self.file_digests = [[name, file_digest(path, self.file_bundle.source)]
+                                 for name, path in sorted(self.file_bundle.files.items())]
+        return digest(json.dumps([self.digest, template, self.file_names, self.file_digests]).encode())
+
     def render(self, pdf: PDF, template=False):
         '''
             renders the question to the page.
             by default, does not start a new page for the first question.
+            a question identical to one already in the pdf copies its pages, see PDF.reuse
         '''
+        pdf.reuse(self.content_key(template), lambda: self.render_question(pdf, template))
+
+    def render_question(self, pdf: PDF, template=False):
         self.question.render(pdf)
-        if get_cfg('questions', 'dumpParams', default=False):
+        if settings.dump_params:
             pdf.multi_cell(lineWidth, lineHeight, txt=json.dumps(self.params))
             draw_line(pdf)
         for i, p in enumerate(self.parts):
@@ -525,10 +669,14 @@ class Submission:
     '''
         encapsulates a student pl submission.
     '''
+    __slots__ = ['uid', 'questions', 'row_digests', 'cache_key']
 
     def __init__(self, uid: str):
         self.uid = uid
         self.questions = dict()
+        # filled in when rendering with a cache, see plgspl.cache
+        self.row_digests = []
+        self.cache_key = None
 
     def add_student_question(self, q: StudentQuestion):
         self.questions[q.variant] = q
@@ -540,9 +688,7 @@ class Submission:
         '''
             renders the title page for a student submission
         '''
-        pdf.set_font(get_cfg('font', 'title', 'font', default="arial"),
-                     size=get_cfg('font', 'title', 'size',
-                                  default=10, cast=int),
+        pdf.set_font(settings.title_font.font, size=settings.title_font.size,
                      style="U")
         pdf.cell(0, 60, ln=1)
         id = self.uid if not template else " " * len(self.uid)
@@ -553,6 +699,10 @@ class Submission:
             renders all of the student's answers/questions to the given question,
             in the order described by the given question map.
         '''
+        with timed('render.submission'):
+            self.render_questions(pdf, qMap, is_template, template_submission)
+
+    def render_questions(self, pdf: PDF, qMap: AssignmentConfig, is_template=False, template_submission=None):
         pdf.add_page()
         self.render_front_page(pdf, is_template)
         for q in qMap.get_question_list():
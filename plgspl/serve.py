@@ -0,0 +1,326 @@
+import copy
+import hmac
+import io
+import json
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from plgspl.batch import check_job, parse_job, run_job
+from plgspl.checkpoint import stat_key
+
+# finished jobs kept for their status and log, oldest dropped first
+MAX_FINISHED = 100
+# the names requests may be sent to, or come from
+LOOPBACK = {'127.0.0.1', 'localhost', '::1'}
+# the log of the job running in this context, see JobOutput
+job_log = ContextVar('job_log', default=None)
+
+
+class Cancelled(BaseException):
+    '''
+        raised from a running pdf job's progress once it's been cancelled, stopping it after its current pdf.
+        like SystemExit, it isn't an Exception, so run_job doesn't report it as the job failing.
+    '''
+
+
+class JobOutput(io.TextIOBase):
+    '''
+        stands in for stdout while the daemon runs. what a job prints goes to its log, and everything else,
+        like the http threads' and the daemon's own output, goes to stdout as usual.
+        the running job is told apart by context, which its writer thread copies, see plgspl.to_pdf.make_writer.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, s):
+        return (job_log.get() or self.stream).write(s)
+
+    def flush(self):
+        (job_log.get() or self.stream).flush()
+
+
+class Job():
+    '''
+        a pdf, merge or classlist job sent to the daemon, see plgspl.batch.parse_job
+    '''
+
+    def __init__(self, id, cmd, args, options):
+        self.id = id
+        self.cmd = cmd
+        self.args = args
+        self.options = options
+        # queued, running, then done, failed or cancelled
+        self.status = 'queued'
+        self.progress = None
+        self.summary = None
+        self.log = io.StringIO()
+        self.cancel = threading.Event()
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def report(self, log=False) -> dict:
+        report = {'id': self.id, 'command': self.cmd, 'args': self.args, 'out': self.options['out'],
+                  'status': self.status, 'progress': self.progress, 'cancelling': self.cancel.is_set(),
+                  'submitted': self.submitted, 'started': self.started, 'finished': self.finished,
+                  'summary': self.summary}
+        if log:
+            report['log'] = self.log.getvalue()
+        return report
+
+
+class Daemon():
+    '''
+        runs jobs one at a time on a single thread, as they change directory into their output.
+        the worker pool, the parsed assessment configs and each process's image and markdown caches
+        stay warm from one job to the next.
+    '''
+
+    def __init__(self, workers=1, base=None):
+        self.workers = workers
+        self.base = base or os.getcwd()
+        self.jobs = dict()
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        # (out file, config) by info json and its size and modification time
+        self.configs = dict()
+        self.pool = None
+        if workers > 1:
+            from plgspl.to_pdf import make_pool
+            self.pool = make_pool(workers)
+        self.stdout = sys.stdout
+        sys.stdout = JobOutput(self.stdout)
+        self.runner = threading.Thread(target=self.run, name='plgspl-jobs', daemon=True)
+        self.runner.start()
+
+    def submit(self, raw) -> Job:
+        '''
+            queues a job. raises ValueError if it isn't well formed, or if a pdf job's inputs can't be found.
+            a merge job's qmap may come from a job still queued, so merge inputs are checked as the job runs.
+        '''
+        cmd, args, options = parse_job(raw, self.base)
+        problem = check_job(cmd, args) if cmd != 'merge' else None
+        if problem:
+            raise ValueError(problem)
+        with self.lock:
+            job = Job(max(self.jobs, default=0) + 1, cmd, args, options)
+            self.jobs[job.id] = job
+            self.prune()
+        self.queue.put(job)
+        return job
+
+    def prune(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del self.jobs[job.id]
+
+    def cancel(self, id) -> Job:
+        '''
+            cancels a queued job, or asks a running pdf job to stop once its current pdf is written.
+            a stopped pdf job leaves its checkpoint, so it can be sent again with resume.
+            merge and classlist jobs run to the end once they've started.
+        '''
+        with self.lock:
+            job = self.jobs.get(id)
+            if job and not job.finished:
+                job.cancel.set()
+                if job.status == 'queued':
+                    job.status, job.finished = 'cancelled', time.time()
+        return job
+
+    def parsed(self, info_json):
+        '''
+            returns info_json parsed, as a copy, since a run adds the files it finds to its config
+        '''
+        from plgspl.to_pdf import parse_config
+        key = (info_json, *stat_key(info_json))
+        if key not in self.configs:
+            self.configs = {k: v for k, v in self.configs.items() if k[0] != info_json}
+            self.configs[key] = parse_config(info_json)
+        return copy.deepcopy(self.configs[key])
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self.lock:
+                if job.cancel.is_set():
+                    continue
+                job.status, job.started = 'running', time.time()
+
+            def progress(done, total):
+                job.progress = {'pdfs': done, 'total': total}
+                if job.cancel.is_set():
+                    raise Cancelled()
+
+            log = job_log.set(job.log)
+            try:
+                parsed = self.parsed(job.args[0]) if job.cmd == 'pdf' and os.path.isfile(job.args[0]) else None
+                job.summary = run_job(job.cmd, job.args, job.options, self.workers, self.pool,
+                                      parsed, progress)
+                job.status = 'done' if job.summary['status'] == 'ok' else 'failed'
+            except Cancelled:
+                print('Cancelled.')
+                job.status = 'cancelled'
+            except SystemExit:
+                # parsing the config exits on a bad config, and has already printed why
+                job.status = 'failed'
+            except Exception:
+                # the daemon outlives a job that breaks
+                traceback.print_exc(file=job.log)
+                job.status = 'failed'
+            finally:
+                job_log.reset(log)
+            job.finished = time.time()
+
+    def status(self) -> dict:
+        from plgspl.content import image_cache, markdown_cache
+        counts = dict()
+        for job in list(self.jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {'pid': os.getpid(), 'workers': self.workers, 'jobs': counts, 'configs': len(self.configs),
+                'caches': {name: {'hits': c.hits, 'misses': c.misses, 'bytes': c.size}
+                           for name, c in (('images', image_cache), ('markdown', markdown_cache))}}
+
+    def close(self):
+        '''
+            stops the running job after its current pdf, drops the queued ones and shuts the pool down
+        '''
+        for job in list(self.jobs.values()):
+            self.cancel(job.id)
+        self.queue.put(None)
+        self.runner.join()
+        if self.pool:
+            self.pool.shutdown()
+        sys.stdout = self.stdout
+
+
+class Handler(BaseHTTPRequestHandler):
+    '''
+        the job api. every request needs the daemon's token, as "Authorization: Bearer TOKEN":
+            GET / - the daemon's status
+            GET /jobs - every job's status
+            POST /jobs - queues the job in the body, e.g. {"pdf": [INFO_JSON, MANUAL_CSV, FILE_DIR], "out": DIR}
+            GET /jobs/ID - a job's status, progress and log
+            DELETE /jobs/ID - cancels a job
+            POST /shutdown - stops the daemon
+    '''
+
+    def allowed(self) -> bool:
+        '''
+            returns whether the request was sent from this machine with the daemon's token, replying 403 or 401 if not.
+            a web page can send requests to localhost too, so the host the request was sent to is checked
+            against dns rebinding, and the page's origin and the token are checked against cross site requests.
+        '''
+        host = urlsplit('//' + self.headers.get('Host', '')).hostname
+        origin = self.headers.get('Origin')
+        if host not in LOOPBACK or (origin is not None and urlsplit(origin).hostname not in LOOPBACK):
+            self.reply(403, {'error': 'Only requests from this machine are accepted'})
+            return False
+        expected = f'Bearer {self.server.token}'.encode()
+        if not hmac.compare_digest(self.headers.get('Authorization', '').encode(), expected):
+            self.reply(401, {'error': 'Send the token the daemon printed on startup, as "Authorization: Bearer TOKEN"'})
+            return False
+        return True
+
+    def reply(self, code, body):
+        data = json.dumps(body, indent=2).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def job(self):
+        '''
+            returns the job the path names, replying 404 if there isn't one
+        '''
+        parts = self.path.strip('/').split('/')
+        job = None
+        if len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+            job = self.server.daemon.jobs.get(int(parts[1]))
+        if not job:
+            self.reply(404, {'error': f'No job at {self.path}'})
+        return job
+
+    def do_GET(self):
+        if not self.allowed():
+            return
+        daemon = self.server.daemon
+        if self.path.rstrip('/') == '':
+            self.reply(200, daemon.status())
+        elif self.path.rstrip('/') == '/jobs':
+            self.reply(200, {'jobs': [job.report() for job in list(daemon.jobs.values())]})
+        else:
+            job = self.job()
+            if job:
+                self.reply(200, job.report(log=True))
+
+    def do_POST(self):
+        if not self.allowed():
+            return
+        if self.path.rstrip('/') == '/shutdown':
+            self.reply(200, {'status': 'stopping'})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        if self.path.rstrip('/') != '/jobs':
+            self.reply(404, {'error': f'No endpoint at {self.path}'})
+            return
+        if self.headers.get_content_type() != 'application/json':
+            self.reply(415, {'error': 'Jobs should be sent as application/json'})
+            return
+        try:
+            raw = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+            job = self.server.daemon.submit(raw)
+        except ValueError as e:
+            self.reply(400, {'error': str(e)})
+            return
+        self.reply(202, job.report())
+
+    def do_DELETE(self):
+        if not self.allowed():
+            return
+        job = self.job()
+        if not job:
+            return
+        if job.finished and job.status != 'cancelled':
+            self.reply(409, {'error': f'Job {job.id} has already {job.status}', **job.report()})
+            return
+        self.reply(200, self.server.daemon.cancel(job.id).report())
+
+
+def make_server(port=8765, workers=1, token=None) -> ThreadingHTTPServer:
+    '''
+        returns a server for the job api on localhost, with a fresh token unless one is given
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.token = token or secrets.token_urlsafe(24)
+    server.daemon = Daemon(workers)
+    return server
+
+
+def serve(port=8765, workers=1, token=None):
+    '''
+        serves the job api on localhost until it's stopped, by POST /shutdown or an interrupt
+    '''
+    server = make_server(port, workers, token)
+    host, port = server.server_address
+    print(f'Serving plgspl jobs on http://{host}:{port} with {workers} worker(s)...')
+    print(f'Token: {server.token}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.daemon.close()
+    print('Stopped.')
@@ -0,0 +1,87 @@
+import json
+import sys
+from typing import Dict, List
+from plgspl.qmap import save_qmap, write_overflow
+
+
+class Shard():
+    '''
+        one of count shards of a pdf run, numbered from 1.
+
+        every shard reads the whole csv and renders the same template, so the expected pages
+        and chunk plan match a single run. chunks are then dealt out to the shards in turn,
+        and each shard only renders its own, keeping the single run's file names.
+    '''
+
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+        # where each of this shard's students sits in the whole class, for combine
+        self.positions: Dict[str, int] = dict()
+
+    @classmethod
+    def parse(cls, s):
+        '''
+            parses a shard given as "i/N"
+        '''
+        try:
+            index, count = map(int, s.split('/'))
+        except ValueError:
+            index, count = 0, 0
+        if not 1 <= index <= count:
+            print("Invalid shard: %s. Expected i/N, where 1 <= i <= N." % s)
+            sys.exit(1)
+        return cls(index, count)
+
+    def has(self, chunk_no) -> bool:
+        return chunk_no % self.count == self.index - 1
+
+    def add(self, i, uid):
+        self.positions[uid] = i
+
+    def path(self, out_file):
+        return f'{out_file}_shard-{self.index}-of-{self.count}.json'
+
+    def write(self, out_file, qmap, pdfs, missing_questions, truncated=()):
+        json.dump({'title': out_file, 'shard': [self.index, self.count],
+                   'students': [[self.positions[uid], uid, questions, pdfs[uid]] for uid, questions in qmap.items()],
+                   'missing': missing_questions,
+                   'truncated': list(truncated)},
+                  open(self.path(out_file), 'w'))
+
+
+def combine(shard_files: List[str], qmap_format='json'):
+    '''
+        merges the qmaps and missing question reports of every shard of a pdf run
+        into the qmap a single run would have written.
+    '''
+    shards = [json.load(open(f)) for f in shard_files]
+    count = shards[0]['shard'][1]
+    indices = sorted(s['shard'][0] for s in shards)
+    if any(s['shard'][1] != count or s['title'] != shards[0]['title'] for s in shards) \
+            or indices != list(range(1, count + 1)):
+        print(f'Expected one shard file of each of 1/{count} to {count}/{count} from the same run.')
+        print('Got:', ', '.join(f"{s['shard'][0]}/{s['shard'][1]} of {s['title']}" for s in shards))
+        sys.exit(1)
+
+    students = sorted(st for s in shards for st in s['students'])
+    positions = {uid: i for i, uid, _, _ in students}
+    qmap = {uid: questions for _, uid, questions, _ in students}
+    pdfs = {uid: pdf for _, uid, _, pdf in students}
+    missing_questions = sorted((uid for s in shards for uid in s['missing']),
+                               key=lambda uid: positions[uid])
+    # sorted stably, so each student's parts stay in render order
+    truncated = sorted((t for s in shards for t in s.get('truncated', [])),
+                       key=lambda t: positions[t[0]])
+    print(f'Combined {len(qmap)} submission(s) from {count} shard(s)..')
+
+    if len(missing_questions) > 0:
+        print(f'{len(missing_questions)} submissions are missing question submissions. Please make sure to manually pair them in gradescope!', missing_questions, sep="\n")
+
+    if len(truncated) > 0:
+        print(f'{len(truncated)} parts ran past their page budget and were truncated. Please check them against the original submissions!')
+
+    out_file = shards[0]['title']
+    save_qmap(out_file, qmap, qmap_format, pdfs)
+    if len(truncated) > 0:
+        write_overflow(out_file, truncated)
@@ -0,0 +1,184 @@
+import json
+import os
+import random
+import struct
+import sys
+import zlib
+import pandas as pd
+
+# part types a synthetic question can be made of, see StudentQuestion.get_question_parts
+PART_TYPES = ['string', 'mc', 'array', 'ndarray', 'symbolic']
+# file kinds a synthetic file question can ask for, see the files section of __defaults.json
+FILE_TYPES = {'code': 'answer.cpp', 'md': 'notes.md', 'pics': 'picture.png'}
+
+GS_COLUMNS = ['Name', 'SID', 'Email', 'Total Score', 'Max Points', 'Status',
+              'Submission ID', 'Submission Time', 'Lateness (H:M:S)', 'View Count']
+
+
+def png(width, height, seed=0) -> bytes:
+    '''
+        returns a noisy rgb png of the given size. noise keeps the image from compressing away.
+    '''
+    rng = random.Random(seed)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    row = bytes(rng.getrandbits(8) for _ in range(width * 3))
+    raw = b''.join(b'\x00' + row[i:] + row[:i] for i in range(height))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw))
+            + chunk(b'IEND', b''))
+
+
+def make_part(kind, name, rng: random.Random):
+    '''
+        returns the (params, true answer, submitted answer) entries for a question part of the given type
+    '''
+    if kind == 'mc':
+        choices = [{'key': k, 'html': f'choice {k}'} for k in 'abcd']
+        return choices, rng.sample(choices, 2), [c['key'] for c in rng.sample(choices, 2)]
+    elif kind == 'array':
+        return '', [rng.randint(0, 99) for _ in range(10)], [rng.randint(0, 99) for _ in range(10)]
+    elif kind == 'ndarray':
+        def nd(): return {'_type': 'ndarray', '_dtype': 'int64',
+                          '_value': [[rng.randint(0, 99) for _ in range(10)]]}
+        return '', nd(), nd()
+    elif kind == 'symbolic':
+        return '', 'x**2 + 1', {'_type': 'sympy', '_value': f'x**2 + {rng.randint(0, 9)}', '_variables': ['x']}
+    return f'context for {name}', str(rng.randint(0, 999)), ' '.join(
+        rng.choice(['lorem', 'ipsum', 'dolor', 'sit', 'amet']) for _ in range(rng.randint(1, 40)))
+
+
+def generate(out_dir, students=100, questions=10, alternatives=1, number_choose=1, parts=3,
+             part_types=PART_TYPES, file_questions=1, file_types=list(FILE_TYPES),
+             code_lines=20, md_paragraphs=5, image_size=256, params_size=0, seed=0):
+    '''
+        writes a synthetic pl export and the matching gradescope scores to out_dir:
+            - info.json: an infoAssessment.json with the given questions and alternatives
+            - ans.csv: a manual grading csv with one row per student question variant
+            - files/: the uploads for the last file_questions questions
+            - gs_scores.csv: gradescope scores for every question part
+            - classlist.csv: a pl classlist with UID and UIN columns
+        params_size pads each question's params with that many extra numbers, mimicking dataframe params.
+        returns a summary of what was generated.
+    '''
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(out_dir, 'files'), exist_ok=True)
+
+    zone = []
+    outline = []
+    for n in range(1, questions + 1):
+        kinds = [part_types[(n + i) % len(part_types)] for i in range(parts)]
+        # multiple choice parts are only detected on "res" prefixed keys
+        names = [f'res{i}' if k == 'mc' else f'p{i}' for i, k in enumerate(kinds, 1)]
+        files = [FILE_TYPES[f] for f in file_types] if n > questions - file_questions else []
+        if alternatives > 1:
+            variants = [f'q{n}/v{a}' for a in range(alternatives)]
+            raw = {'numberChoose': number_choose, 'points': 1,
+                   'alternatives': [{'id': v, 'points': 1} for v in variants]}
+        else:
+            variants = [f'q{n}']
+            raw = {'id': variants[0], 'points': 1}
+        if files:
+            raw['files'] = files
+        zone.append(raw)
+        outline.append((variants, list(zip(names, kinds)), files))
+    json.dump({'title': 'Synthetic Assessment', 'zones': [{'questions': zone}]},
+              open(os.path.join(out_dir, 'info.json'), 'w'), indent=2)
+
+    image = png(image_size, image_size, seed)
+    padding = list(range(params_size))
+    rows, gs_rows, classlist = [], [], []
+    sid = 0
+    file_count = 0
+    for s in range(students):
+        uid = f'student{s:05d}@example.edu'
+        scores = []
+        for variants, qparts, files in outline:
+            for qid in rng.sample(variants, min(number_choose, len(variants))):
+                sid += 1
+                params, true_ans, ans, partials = {'padding': padding}, {}, {}, {}
+                for name, kind in qparts:
+                    params[name], true_ans[name], ans[name] = make_part(
+                        kind, name, rng)
+                    partials[name] = {'score': rng.choice(
+                        [0, 0.5, 1]), 'weight': 1}
+                rows.append([uid, s, qid, 0, sid, json.dumps(params), json.dumps(true_ans),
+                             json.dumps(ans), json.dumps(partials), '', ''])
+                for f in files:
+                    path = os.path.join(
+                        out_dir, 'files', f'{uid}_{s}_{qid.replace("/", "_")}_{sid}_{f}')
+                    if f.endswith('.png'):
+                        open(path, 'wb').write(image)
+                    elif f.endswith('.md'):
+                        open(path, 'w').write('\n\n'.join(
+                            f'## Section {i}\n\nSome *markdown* text for paragraph {i}.' for i in range(md_paragraphs)))
+                    else:
+                        open(path, 'w').write('\n'.join(
+                            f'int line{i} = {i};' for i in range(code_lines)))
+                    file_count += 1
+            for _ in range(min(number_choose, len(variants))):
+                scores.extend(rng.choice([0, 1])
+                              for _ in range(len(qparts) + len(files)))
+        gs_rows.append([uid, uid.split('@', 1)[0], uid, sum(scores), len(scores), 'Graded',
+                        s, '', '0:00:00', 0] + scores)
+        classlist.append([uid, s])
+
+    # merge pairs each variant a student was given with one gradescope question
+    gs_parts = []
+    n = 0
+    for variants, qparts, files in outline:
+        names = [name for name, _ in qparts] + files
+        for _ in range(min(number_choose, len(variants))):
+            n += 1
+            for i, name in enumerate(names, 1):
+                label = f'{n}.{i}' if len(names) > 1 else f'{n}'
+                gs_parts.append(f'{label}: {name} (1.0 pts)')
+
+    pd.DataFrame(rows, columns=['uid', 'UIN', 'qid', 'old_score_perc', 'submission_id', 'params', 'true_answer',
+                                'submitted_answer', 'partial_scores', 'score_perc', 'feedback']).to_csv(
+        os.path.join(out_dir, 'ans.csv'), index=False)
+    pd.DataFrame(gs_rows, columns=GS_COLUMNS + gs_parts).to_csv(
+        os.path.join(out_dir, 'gs_scores.csv'), index=False)
+    pd.DataFrame(classlist, columns=['UID', 'UIN']).to_csv(
+        os.path.join(out_dir, 'classlist.csv'), index=False)
+    return {'students': students, 'rows': len(rows), 'files': file_count, 'gs_parts': len(gs_parts)}
+
+
+def pop_options(args):
+    '''
+        removes the generator options from the given argument list, returning them as generate kwargs
+    '''
+    from plgspl.plgspl import pop_option
+    return dict(students=pop_option(args, 'students', 100, int),
+                questions=pop_option(args, 'questions', 10, int),
+                alternatives=pop_option(args, 'alternatives', 1, int),
+                number_choose=pop_option(args, 'number-choose', 1, int),
+                parts=pop_option(args, 'parts', 3, int),
+                part_types=pop_option(args, 'part-types', PART_TYPES, lambda s: s.split(',')),
+                file_questions=pop_option(args, 'file-questions', 1, int),
+                file_types=pop_option(args, 'file-types', list(FILE_TYPES), lambda s: s.split(',')),
+                code_lines=pop_option(args, 'code-lines', 20, int),
+                md_paragraphs=pop_option(args, 'md-paragraphs', 5, int),
+                image_size=pop_option(args, 'image-size', 256, int),
+                params_size=pop_option(args, 'params-size', 0, int),
+                seed=pop_option(args, 'seed', 0, int))
+
+
+def main():
+    args = sys.argv[1:]
+    usage = 'Usage: python -m plgspl.synthetic <OUT_DIR> [--students N] [--questions N] ...'
+    if '--help' in args or '-h' in args:
+        print(usage)
+        return
+    opts = pop_options(args)
+    # an unknown option would otherwise be taken for the output directory
+    if len(args) != 1 or args[0].startswith('-'):
+        print(usage)
+        sys.exit(1)
+    print(generate(args[0], **opts))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,33 @@
 import pandas as pd
 import plgspl.questions as qs
 from plgspl.types import PDF
+import io
 import os
 import json
-from plgspl.cfg import get_cfg
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from collections import deque
+from contextlib import nullcontext, redirect_stdout
+from functools import partial
+from itertools import chain
+from plgspl.cfg import settings
+from plgspl.files import FileIndex, file_size
+from plgspl.qmap import save_qmap, write_overflow
+from plgspl.shard import Shard
+from plgspl.checkpoint import Checkpoint, checkpoint_path, run_key
+from plgspl.cache import RenderCache, capture, capture_state, splice
+import plgspl.metrics as metrics
+from plgspl.metrics import timed
 
+# finished chunks that may wait on the writer while the next chunk renders.
+# each one holds a whole pdf in memory, so rendering blocks rather than let more pile up.
+WRITE_QUEUE = 1
 
-def to_pdf(info_json, manual_csv, file_dir=None):
-    submissions = dict()
+def parse_config(info_json):
+    '''
+        parses an infoAssessment.json style config.
+        returns the output file prefix and the assignment config.
+    '''
     config = qs.AssignmentConfig()
 
     # load the raw assignment config file
@@ -19,101 +39,670 @@ def to_pdf(info_json, manual_csv, file_dir=None):
     for z in zones:
         for i, raw_q in enumerate(z['questions']):
             parts = raw_q['parts'] if 'parts' in raw_q else []
-            files = set(raw_q['files']) if 'files' in raw_q else set()
+            # file parts are drawn in the order the config lists them, the same in every process
+            files = list(dict.fromkeys(raw_q.get('files', [])))
+            part_kinds = raw_q.get('partTypes', {})
+            for p, kind in part_kinds.items():
+                if kind not in qs.PART_KINDS:
+                    print(f'Unknown part type {kind} for part {p} in {info_json}.')
+                    print('Part types are one of:', ', '.join(qs.PART_KINDS))
+                    exit(1)
             if 'id' not in raw_q:
                 vs = list(map(lambda q: q['id'], raw_q['alternatives']))
                 q = qs.QuestionInfo(vs[0], i + 1,
                                     variants=vs, number_choose=raw_q['numberChoose'],
-                                    parts=parts, expected_files=files)
+                                    parts=parts, expected_files=files, part_kinds=part_kinds)
             else:
                 q = qs.QuestionInfo(
-                    raw_q['id'], i + 1, parts=parts, expected_files=files)
+                    raw_q['id'], i + 1, parts=parts, expected_files=files, part_kinds=part_kinds)
             config.add_question(q)
     print(
         f'Parsed config. Created {config.get_question_count()} questions and {config.get_variant_count()} variants.', end='\n\n')
+    return out_file, config
 
-    # iterate over the rows of the csv and parse the data
-    print(
-        f'Parsing submissions from {manual_csv} and provided file directory (if any)')
-    manual = pd.read_csv(manual_csv)
-    for i, m in manual.iterrows():
-        uid_full = m.get('uid', m.get('UID'))
-        uid = str(uid_full).split("@", 1)[0]
 
-        qid = m['qid']
-        sid = m['submission_id']
+def parse_row(m, config: qs.AssignmentConfig, file_index: FileIndex = None):
+    '''
+        parses a row of the manual grading csv.
+        returns the student's uid and their question, or None if the question isn't in the config.
+    '''
+    uid_full = m.get('uid', m.get('UID'))
+    uid = str(uid_full).split("@", 1)[0]
+
+    qid = m['qid']
+    sid = m['submission_id']
+
+    q = config.get_question(qid)
+    if not q:
+        return uid, None
+
+    # look for any files related to this question submission
+    fns = []
+    if file_index:
+        # if it has the student id, and the qid_sid pair, count it as acceptable
+        with timed('files.find'):
+            paths = file_index.find(uid_full, qid, sid, q.expected_files)
+        for path in paths:
+            fns.append(path)
+            q.add_file(path, qid)
 
+    return uid, qs.StudentQuestion(q, m['params'], m['true_answer'],
+                                   m['submitted_answer'], m['partial_scores'],
+                                   qs.StudentFileBundle(
+                                       fns, qid, file_index.source if file_index else None),
+                                   qid)
+
+
+def read_submissions(manual_csv, config, file_index=None, cache: RenderCache = None):
+    '''
+        reads every submission in the manual grading csv into memory, keyed by uid.
+    '''
+    submissions = dict()
+    with timed('read_csv'):
+        manual = pd.read_csv(manual_csv)
+    for _, m in manual.iterrows():
+        uid, sq = parse_row(m, config, file_index)
         submission = submissions.get(uid)
         if not submission:
             submission = qs.Submission(uid)
             submissions[uid] = submission
-        q = config.get_question(qid)
-        if not q:
-            continue
+        if cache:
+            submission.row_digests.append(cache.row_digest(m))
+        if sq:
+            submission.add_student_question(sq)
+    return submissions
+
+
+def stream_submissions(manual_csv, config, file_index=None, cache: RenderCache = None, chunksize=1000):
+    '''
+        yields the submissions in the manual grading csv one student at a time,
+        reading the csv chunksize rows at a time.
+        a student's rows must be contiguous, as they are in pl's exports.
+    '''
+    submission = None
+    seen = set()
+    reader = pd.read_csv(manual_csv, chunksize=chunksize)
+    while True:
+        with timed('read_csv'):
+            manual = next(reader, None)
+        if manual is None:
+            break
+        for _, m in manual.iterrows():
+            uid, sq = parse_row(m, config, file_index)
+            if not submission or submission.uid != uid:
+                if uid in seen:
+                    print(f'The rows for {uid} are not contiguous in {manual_csv}.')
+                    print('Please sort the csv by uid, or run without --stream.')
+                    exit(1)
+                seen.add(uid)
+                if submission:
+                    yield submission
+                submission = qs.Submission(uid)
+            if cache:
+                submission.row_digests.append(cache.row_digest(m))
+            if sq:
+                submission.add_student_question(sq)
+    if submission:
+        yield submission
+
+
+class ChunkPlanner:
+    '''
+        decides where output chunks end, one submission at a time.
+
+        a chunk is closed once it holds max_submissions, or before a submission whose estimated size
+        would take it over max_bytes. a chunk always holds at least one whole submission.
+        the first chunk holds one extra submission; this mirrors the historical naming of the output files.
+    '''
+
+    def __init__(self, max_submissions, max_bytes=0):
+        self.max_submissions = max_submissions
+        self.max_bytes = max_bytes
+        self.start = 0
+        self.count = 0
+        self.bytes = 0
+        self.chunk_no = 0
+
+    def fits(self, size) -> bool:
+        '''
+            returns whether a submission of the given estimated size fits in the open chunk
+        '''
+        if self.count == 0:
+            return True
+        limit = self.max_submissions + (1 if self.start == 0 else 0)
+        return self.count < limit and not (self.max_bytes and self.bytes + size > self.max_bytes)
+
+    def add(self, size):
+        self.count += 1
+        self.bytes += size
+
+    def close(self):
+        '''
+            closes the open chunk, returning its (name, start, end)
+        '''
+        end = self.start + self.count
+        chunk = (f'{max(self.start, 1)}-{end}', self.start, end)
+        self.start, self.count, self.bytes = end, 0, 0
+        self.chunk_no += 1
+        return chunk
+
 
-        # look for any files related to this question submission
-        fns = []
-        if file_dir:
-            for fn in os.listdir(file_dir):
-                # if it has the student id, and the qid_sid pair, count it as acceptable
-                if fn.find(uid_full) > -1 and fn.find(f'{qs.escape_qid(qid)}_{sid}') > -1 and qs.parse_filename(fn, qid) in q.expected_files:
-                    fns.append(os.path.join(file_dir, fn))
-                    q.add_file(os.path.join(file_dir, fn))
-
-        submission.add_student_question(
-            qs.StudentQuestion(q, m['params'], m['true_answer'],
-                               m['submitted_answer'], m['partial_scores'],
-                               qs.StudentFileBundle(fns, qid), qid))
-    print(f'Created {len(submissions)} submission(s)..')
-
-    pdf = PDF()
-
-    def pdf_output(pdf, name):
-        pdf.output(os.path.join(os.getcwd(), f'{out_file}_{name}.pdf'))
-
-    prev = 1
-    expected_pages = 0
-    template_submission = None
-    missing_questions = []
-    for i, (_, v) in enumerate(submissions.items()):
-        v: qs.Submission
-        # print(f'Printing out {v.uid}\'s submission to a pdf')
+def plan_chunks(count, max_submissions, sizes=None, max_bytes=0):
+    '''
+        splits count submissions into output chunks, see ChunkPlanner.
+        sizes are the estimated bytes of each submission.
+        returns a list of (name, start, end) tuples, where start:end slices the submissions.
+    '''
+    planner = ChunkPlanner(max_submissions, max_bytes)
+    chunks = []
+    for i in range(count):
+        size = sizes[i] if sizes else 0
+        if not planner.fits(size):
+            chunks.append(planner.close())
+        planner.add(size)
+    if planner.count:
+        chunks.append(planner.close())
+    return chunks
+
+
+def estimate_bytes(v: qs.Submission, page_bytes) -> int:
+    '''
+        estimates the bytes a submission adds to an output pdf: the template's pages plus the student's uploads
+    '''
+    return page_bytes + sum(file_size(p, sq.file_bundle.source)
+                            for sq in v.questions.values() for p in sq.file_bundle.files.values())
+
+
+def chunk_file(out_file, name):
+    return f'{out_file}_{name}.pdf'
+
+
+class ChunkRenderer:
+    '''
+        renders submissions one at a time into a single output pdf,
+        padding each submission out to the expected number of pages.
+    '''
+
+    def __init__(self, config: qs.AssignmentConfig, template_submission: qs.Submission, expected_pages: int,
+                 cache: RenderCache = None):
+        self.config = config
+        self.template_submission = template_submission
+        self.expected_pages = expected_pages
+        self.cache = cache
+        self.pdf = PDF()
+        self.missing_questions = []
+        # [uid, what was cut short] for every part truncated to its page budget
+        self.truncated = []
+        self.submissions = 0
+
+    def add(self, i, v: qs.Submission):
+        '''
+            renders v, the i-th submission in the overall class list.
+            with a cache, reuses v's pages from a previous run when nothing about v has changed.
+        '''
+        truncated = len(self.pdf.truncated)
+        if not self.cache:
+            missing = self.render(i, v)
+        else:
+            key = self.cache.fragment_key(v, i == 0, self.template_submission,
+                                          self.expected_pages, capture_state(self.pdf))
+            fragment = self.cache.load(key)
+            if fragment:
+                with timed('cache.splice'):
+                    missing = splice(self.pdf, fragment)
+            else:
+                start = self.pdf.page_no()
+                missing = self.render(i, v)
+                self.cache.store(key, capture(self.pdf, start, missing, self.pdf.truncated[truncated:]))
+        if missing:
+            self.missing_questions.append(v.uid)
+        self.truncated.extend([v.uid, info] for info in self.pdf.truncated[truncated:])
+        self.submissions += 1
+
+    def render(self, i, v: qs.Submission):
+        '''
+            renders v, the i-th submission in the overall class list.
+            returns whether v was missing questions.
+        '''
+        pdf = self.pdf
         start_page = pdf.page_no()
+        # the template submission itself is rendered without a template to fall back on
         v.render_submission(
-            pdf, config, template_submission=template_submission)
-        if i == 0:
-            sample_pdf = PDF()
-            v.render_submission(sample_pdf, config, True)
-            template_submission = v
-            pdf_output(sample_pdf, "sample")
-            expected_pages = sample_pdf.page_no()
-            max_submissions = get_cfg('gs', 'pagesPerPDF') / expected_pages
-            if max_submissions < 1:
-                print('Cannot create submissions given the current max page constraint.')
-                print('Please adjust your defaults.')
-                exit(1)
-            max_submissions = int(max_submissions)
+            pdf, self.config, template_submission=self.template_submission if i != 0 else None)
         diff = pdf.page_no() - start_page
 
-        if diff < expected_pages:
-            missing_questions.append(v.uid)
-        elif diff > expected_pages:
-            print(
-                f'Submission {i}, {v.uid} exceeds the sample template. Please make sure that the first submission is complete')
-            exit(1)
-        while pdf.page_no() - start_page < expected_pages:
+        if diff > self.expected_pages:
+            if not pdf.truncate:
+                print(
+                    f'Submission {i}, {v.uid} exceeds the sample template. Please make sure that the first submission is complete')
+                exit(1)
+            pdf.truncate_to(start_page + self.expected_pages, 'the submission')
+            diff = self.expected_pages
+        while pdf.page_no() - start_page < self.expected_pages:
             pdf.add_page()
-            pdf.cell(0, 20, f'THIS IS A BLANK PAGE', ln=1, align='C')
+            pdf.stamp('blank page', lambda: pdf.cell(0, 20, 'THIS IS A BLANK PAGE', ln=1, align='C'))
+        return diff < self.expected_pages
+
+    def output(self, path):
+        '''
+            writes the pdf to path, syncing it to disk. returns the uids of submissions that were missing questions,
+            and the [uid, part] pairs that were truncated.
+        '''
+        with timed('pdf.output'):
+            data = self.pdf.output(dest='S').encode('latin1')
+            with open(path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        if self.pdf.image_bytes_saved > 0:
+            print(f'{os.path.basename(path)}: downscaling images saved {self.pdf.image_bytes_saved / 2 ** 20:.1f} MiB')
+        if self.pdf.reused > 0:
+            print(f'{os.path.basename(path)}: {self.pdf.reused} of {self.pdf.reusable} questions were identical to one '
+                  f'already rendered ({self.pdf.reused / self.pdf.reusable:.0%} deduplicated)')
+        metrics.record_chunk(path, os.path.getsize(path) if metrics.enabled else 0,
+                             self.pdf.page_no(), self.submissions, self.pdf.image_bytes_saved,
+                             self.pdf.reusable, self.pdf.reused)
+        return self.missing_questions, self.truncated
+
+
+def render_submissions(chunk, offset, config, template_submission, expected_pages, cache=None) -> ChunkRenderer:
+    '''
+        renders the given submissions into a single pdf, without writing it.
+        offset is the index of the first submission in the overall class list.
+    '''
+    renderer = ChunkRenderer(
+        config, template_submission, expected_pages, cache)
+    for i, v in enumerate(chunk, offset):
+        renderer.add(i, v)
+    return renderer
+
+
+def render_chunk(path, chunk, offset, config, template_submission, expected_pages, cache=None):
+    '''
+        renders the given submissions to a single pdf at path.
+        returns the uids of submissions that were missing questions, and the [uid, part] pairs that were truncated.
+    '''
+    return render_submissions(chunk, offset, config, template_submission, expected_pages, cache).output(path)
+
+
+def render_chunk_in_worker(*args, **kwargs):
+    '''
+        runs render_chunk in a pool worker.
+        returns the chunk's result, the metrics the worker recorded for it, and what it printed.
+        the worker's stdout isn't the caller's, e.g. a plgspl serve job's log, so from_worker prints it there.
+    '''
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            result = render_chunk(*args, **kwargs)
+    except BaseException:
+        # a chunk that fails still says why, on the worker's own stdout
+        print(output.getvalue(), end='')
+        raise
+    return result, metrics.collect(), output.getvalue()
+
+
+def make_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, initializer=metrics.init_worker, initargs=(metrics.enabled,))
+
+
+def from_worker(result):
+    result, snapshot, output = result
+    metrics.merge(snapshot)
+    print(output, end='')
+    return result
+
+
+def adopt_context(context: contextvars.Context):
+    for var, value in context.items():
+        var.set(value)
+
+
+def make_writer():
+    '''
+        returns the thread that finished chunks are serialized, compressed and written on.
+        zlib and file writes release the gil, so they overlap with rendering the next chunk.
+        the thread runs in a copy of the caller's context, so e.g. plgspl serve logs what it prints to the caller's job.
+    '''
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='plgspl-writer',
+                              initializer=adopt_context, initargs=(contextvars.copy_context(),))
+
+
+def abandon(futures):
+    '''
+        stops a run's pending chunks: those that haven't started are dropped, and those rendering or writing
+        are waited for, so nothing is left writing pdfs, or holding up a shared pool, once the run has stopped.
+    '''
+    for future in futures:
+        future.cancel()
+    wait(futures)
+
+
+def written(path, future):
+    '''
+        waits for the writer to finish the pdf at path, returning its ChunkRenderer.output.
+        exits if the pdf couldn't be written.
+    '''
+    try:
+        return future.result()
+    except OSError as e:
+        print(f'Unable to write {path}: {e}')
+        exit(1)
+
+
+def render_sample(out_file, config, template_submission, cache: RenderCache = None, write=True):
+    '''
+        renders the template submission as the blank sample pdf, writing it unless write is false.
+        returns the expected pages per submission, the max submissions per output pdf,
+        and the size of the sample, which bounds the size of a submission without uploads.
+    '''
+    sample_pdf = PDF()
+    with timed('render.sample'):
+        template_submission.render_submission(sample_pdf, config, True)
+    path = os.path.join(os.getcwd(), f'{out_file}_sample.pdf')
+    key = cache.student_key(template_submission) if cache else None
+    if write and not (cache and cache.unchanged(path, key)):
+        sample_pdf.output(path)
+        if cache:
+            cache.record(path, key)
+    sample_pdf.close()
+    expected_pages = sample_pdf.page_no()
+    max_submissions = settings.pages_per_pdf / expected_pages
+    if max_submissions < 1:
+        print('Cannot create submissions given the current max page constraint.')
+        print('Please adjust your defaults.')
+        exit(1)
+    return expected_pages, int(max_submissions), len(sample_pdf.buffer)
+
+
+def stream_pdf(out_file, config, students, workers=1, cache: RenderCache = None, shard: Shard = None,
+               checkpoint: Checkpoint = None, pool: ProcessPoolExecutor = None, progress=None):
+    '''
+        renders submissions as they are yielded by students, without holding the whole class in memory.
+        serially, each submission is rendered as soon as it arrives and is then dropped.
+        with workers, each full chunk is handed to the pool; at most workers chunks are in flight.
+        otherwise, each full chunk is handed to the writer and the next one starts rendering.
+        with a shard, only the shard's chunks are rendered.
+        with a checkpoint, each chunk is recorded once it's written, and chunks it has already recorded are skipped.
+        with workers, pool is used rather than starting a pool of its own, if it's given.
+        progress is called with the number of chunks finished as each one is, see to_pdf.
+        returns the qmap, the output pdf each student is in, the uids of submissions that were missing questions,
+        and the [uid, part] pairs that were truncated.
+    '''
+    qmap, pdfs = dict(), dict()
+    missing_questions, truncated = [], []
+    template_submission = next(students, None)
+    if not template_submission:
+        return qmap, pdfs, missing_questions, truncated
+    expected_pages, max_submissions, page_bytes = render_sample(
+        out_file, config, template_submission, cache, not shard or shard.index == 1)
+    if checkpoint:
+        checkpoint.start(template_submission.uid, expected_pages, max_submissions)
+    render = partial(render_chunk_in_worker, config=config,
+                     template_submission=template_submission,
+                     expected_pages=expected_pages, cache=cache)
+
+    shared = pool
+    pool = (shared or make_pool(workers)) if workers > 1 else None
+    writer = make_writer() if not pool else None
+    pending = deque()
+    # makes the same chunks as plan_chunks, without knowing the class size up front
+    planner = ChunkPlanner(max_submissions, settings.max_pdf_bytes)
+    chunk, keys, uids, renderer = [], [], [], None
+    # the checkpoint's entry for the open chunk, if an earlier run finished it
+    done = None
+    finished = 0
+
+    def advance():
+        nonlocal finished
+        finished += 1
+        if progress:
+            progress(finished, None)
+
+    def finish(path, key, result):
+        missing_questions.extend(result[0])
+        truncated.extend(result[1])
+        if cache:
+            cache.record(path, key, *result)
+        advance()
+
+    def drain(limit):
+        while len(pending) > limit:
+            path, key, future = pending.popleft()
+            finish(path, key, from_worker(future.result()) if pool else written(path, future))
+
+    def submit(future, path, key, offset, chunk_qmap):
+        if checkpoint:
+            checkpoint.record_when_written(future, offset, path, chunk_qmap, worker=bool(pool))
+        pending.append((path, key, future))
+
+    def close():
+        nonlocal chunk, keys, uids, renderer, done
+        mine = not shard or shard.has(planner.chunk_no)
+        name, offset, _ = planner.close()
+        if mine and done:
+            qmap.update(done['qmap'])
+            pdfs.update(dict.fromkeys(done['qmap'], done['name']))
+            missing_questions.extend(done['missing'])
+            truncated.extend(done['truncated'])
+            advance()
+        elif mine:
+            pdfs.update(dict.fromkeys(uids, chunk_file(out_file, name)))
+            chunk_qmap = {uid: qmap[uid] for uid in uids}
+            path = os.path.join(os.getcwd(), chunk_file(out_file, name))
+            key = cache.chunk_key(keys, offset, template_submission,
+                                  expected_pages) if cache else None
+            entry = cache.unchanged(path, key) if cache else None
+            if entry:
+                result = (entry['missing'], entry.get('truncated', []))
+                if checkpoint:
+                    checkpoint.record(offset, path, result, chunk_qmap)
+                finish(path, key, result)
+            elif pool:
+                submit(pool.submit(render, path, chunk, offset), path, key, offset, chunk_qmap)
+                drain(workers)
+            else:
+                submit(writer.submit(renderer.output, path), path, key, offset, chunk_qmap)
+                drain(WRITE_QUEUE)
+        chunk, keys, uids, renderer, done = [], [], [], None, None
+
+    try:
+        count = 0
+        for i, v in enumerate(chain([template_submission], students)):
+            count = i + 1
+            size = estimate_bytes(v, page_bytes) if planner.max_bytes else 0
+            if not planner.fits(size):
+                close()
+            if checkpoint and planner.count == 0:
+                done = checkpoint.finished(i)
+            planner.add(size)
+            if shard and not shard.has(planner.chunk_no):
+                continue
+            if shard:
+                shard.add(i, v.uid)
+            if done:
+                continue
+            qmap[v.uid] = v.list_questions(config)
+            uids.append(v.uid)
+            if cache:
+                keys.append(cache.student_key(v))
+            if pool:
+                chunk.append(v)
+            else:
+                renderer = renderer or ChunkRenderer(
+                    config, template_submission, expected_pages, cache)
+                renderer.add(i, v)
+        close()
+        drain(0)
+    finally:
+        abandon([future for *_, future in pending])
+        if pool is not shared:
+            (pool or writer).shutdown()
+    print(f'Rendered {count} submission(s)..')
+    return qmap, pdfs, missing_questions, truncated
+
+
+def render_pdf(out_file, config, students, workers=1, cache: RenderCache = None, shard: Shard = None,
+               checkpoint: Checkpoint = None, pool: ProcessPoolExecutor = None, progress=None):
+    '''
+        renders the given submissions to chunked output pdfs, using the first submission as the template.
+        with a cache, chunks whose submissions haven't changed since the last run are left as they are.
+        with a shard, only the shard's chunks are rendered.
+        with a checkpoint, each chunk is recorded once it's written, and chunks it has already recorded are skipped.
+        with workers, pool is used rather than starting a pool of its own, if it's given.
+        progress is called with the number of chunks finished and the number there are, see to_pdf.
+        returns the qmap, the output pdf each student is in, the uids of submissions that were missing questions,
+        and the [uid, part] pairs that were truncated.
+    '''
+    qmap, pdfs = dict(), dict()
+    missing_questions, truncated = [], []
+    if len(students) == 0:
+        return qmap, pdfs, missing_questions, truncated
+    # the first student doubles as the template for every other submission
+    template_submission = students[0]
+    expected_pages, max_submissions, page_bytes = render_sample(
+        out_file, config, template_submission, cache, not shard or shard.index == 1)
+    if checkpoint:
+        checkpoint.start(template_submission.uid, expected_pages, max_submissions)
+    sizes = [estimate_bytes(v, page_bytes)
+             for v in students] if settings.max_pdf_bytes else None
+
+    jobs, results, reused = [], [], 0
+    for n, (name, start, end) in enumerate(plan_chunks(len(students), max_submissions, sizes, settings.max_pdf_bytes)):
+        if shard and not shard.has(n):
+            continue
+        if shard:
+            for i, v in enumerate(students[start:end], start):
+                shard.add(i, v.uid)
+        done = checkpoint.finished(start) if checkpoint else None
+        if done:
+            qmap.update(done['qmap'])
+            pdfs.update(dict.fromkeys(done['qmap'], done['name']))
+            results.append((done['missing'], done['truncated']))
+            continue
+        chunk_qmap = {v.uid: v.list_questions(config) for v in students[start:end]}
+        qmap.update(chunk_qmap)
+        pdfs.update(dict.fromkeys(chunk_qmap, chunk_file(out_file, name)))
+        path = os.path.join(os.getcwd(), chunk_file(out_file, name))
+        key = cache.chunk_key([cache.student_key(v) for v in students[start:end]], start,
+                              template_submission, expected_pages) if cache else None
+        entry = cache.unchanged(path, key) if cache else None
+        results.append((entry['missing'], entry.get('truncated', [])) if entry else None)
+        if entry:
+            reused += 1
+            if checkpoint:
+                checkpoint.record(start, path, results[-1], chunk_qmap)
+        else:
+            jobs.append((len(results) - 1, key, chunk_qmap, (path, students[start:end], start)))
+    if reused:
+        print(f'Reusing {reused} unchanged pdf(s)...')
+    if progress:
+        progress(len(results) - len(jobs), len(results))
+
+    def finish(n, key, job, result):
+        results[n] = result
+        if cache:
+            cache.record(job[0], key, *result)
+        if progress:
+            progress(sum(r is not None for r in results), len(results))
+
+    options = dict(config=config, template_submission=template_submission,
+                   expected_pages=expected_pages, cache=cache)
+    pending = deque()
+
+    def drain(limit):
+        while len(pending) > limit:
+            (n, key, job), future = pending.popleft()
+            finish(n, key, job, from_worker(future.result()) if workers > 1 else written(job[0], future))
+
+    def submit(future, n, key, chunk_qmap, job):
+        path, _, start = job
+        if checkpoint:
+            checkpoint.record_when_written(future, start, path, chunk_qmap, worker=workers > 1)
+        pending.append(((n, key, job), future))
+
+    if workers > 1 and len(jobs) > 0:
+        print(f'Rendering {len(jobs)} pdf(s) with {workers} workers...')
+        render = partial(render_chunk_in_worker, **options)
+        with nullcontext(pool) if pool else make_pool(workers) as pool:
+            try:
+                # like stream_pdf, at most workers chunks wait behind the ones rendering
+                for n, key, chunk_qmap, job in jobs:
+                    submit(pool.submit(render, *job), n, key, chunk_qmap, job)
+                    drain(workers)
+                drain(0)
+            finally:
+                abandon([future for _, future in pending])
+    else:
+        # each chunk is written in the background while the next one renders
+        with make_writer() as writer:
+            try:
+                for n, key, chunk_qmap, job in jobs:
+                    path, chunk, start = job
+                    renderer = render_submissions(chunk, start, **options)
+                    submit(writer.submit(renderer.output, path), n, key, chunk_qmap, job)
+                    drain(WRITE_QUEUE)
+                drain(0)
+            finally:
+                abandon([future for _, future in pending])
+    for missing, cut in results:
+        missing_questions.extend(missing)
+        truncated.extend(cut)
+    return qmap, pdfs, missing_questions, truncated
+
+
+def to_pdf(info_json, manual_csv, file_dir=None, workers=1, stream=False, cache_dir=None, qmap_format='json',
+           shard: Shard = None, resume=False, pool: ProcessPoolExecutor = None, parsed=None, progress=None):
+    '''
+        renders the submissions in manual_csv to output pdfs and writes their qmap, all in the current directory.
+        with workers, chunks are rendered on pool if it's given, so several runs can share one pool.
+        parsed is the output of parse_config for info_json, if it's already been parsed.
+        progress, if given, is called with the number of output pdfs finished and the number there will be
+        (None when streaming) each time one is. an exception it raises stops the run, leaving its checkpoint
+        to resume from.
+        returns the output file prefix, the qmap, the output pdf each student is in,
+        the uids of submissions that were missing questions, and the [uid, part] pairs that were truncated.
+    '''
+    with timed('parse.config'):
+        out_file, config = parsed or parse_config(info_json)
+    cache = RenderCache(cache_dir, info_json) if cache_dir else None
+    checkpoint = Checkpoint.open(checkpoint_path(out_file, shard),
+                                 run_key(info_json, manual_csv, file_dir, shard), resume)
+
+    try:
+        # iterate over the rows of the csv and parse the data
+        print(
+            f'Parsing submissions from {manual_csv} and provided file directory (if any)')
+        with timed('files.index'):
+            file_index = FileIndex.load(
+                file_dir, config.questions.keys()) if file_dir else None
+        if stream:
+            qmap, pdfs, missing_questions, truncated = stream_pdf(
+                out_file, config, stream_submissions(manual_csv, config, file_index, cache), workers, cache, shard,
+                checkpoint, pool, progress)
+        else:
+            submissions = read_submissions(manual_csv, config, file_index, cache)
+            print(f'Created {len(submissions)} submission(s)..')
+            qmap, pdfs, missing_questions, truncated = render_pdf(
+                out_file, config, list(submissions.values()), workers, cache, shard, checkpoint, pool, progress)
+        if cache:
+            cache.save()
 
-        if i != 0 and i % max_submissions == 0:
-            pdf_output(pdf, f'{i - max_submissions + 1}-{i + 1}')
-            prev = i + 1
-            pdf = PDF()
+        if len(missing_questions) > 0:
+            print(f'{len(missing_questions)} submissions are missing question submissions. Please make sure to manually pair them in gradescope!', missing_questions, sep="\n")
+        if len(truncated) > 0:
+            print(f'{len(truncated)} parts ran past their page budget and were truncated. Please check them against the original submissions!')
 
-    if prev < len(submissions) or len(submissions) == 1:
-        pdf_output(pdf, f'{prev}-{len(submissions)}')
-    if len(missing_questions) > 0:
-        print(f'{len(missing_questions)} submissions are missing question submissions. Please make sure to manually pair them in gradescope!', missing_questions, sep="\n")
+        if shard:
+            # plgspl combine merges the shards into the qmap of a single run
+            shard.write(out_file, qmap, pdfs, missing_questions, truncated)
+        else:
+            save_qmap(out_file, qmap, qmap_format, pdfs)
+            if len(truncated) > 0:
+                write_overflow(out_file, truncated)
+        checkpoint.remove()
+    finally:
+        # a run that stops early leaves its checkpoint to resume from, but not open
+        checkpoint.close()
+    return out_file, qmap, pdfs, missing_questions, truncated
 
-    json.dump({k: v.list_questions(config)
-               for k, v in submissions.items()}, open(f'{out_file}_qmap.json', 'w'))
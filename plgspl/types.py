@@ -1,4 +1,313 @@
+import collections
+import os
+import re
+import tempfile
+import zlib
 from fpdf import FPDF, HTMLMixin
+from plgspl.cfg import settings
+from plgspl.content import digest, image_cache
+from plgspl import images
+
+# pdf state carried from one submission into the next. add_page re-emits most of it,
+# so a submission's pages, or stamped content, can only be reused when it starts from the same state.
+ENTRY_STATE = ['font_family', 'font_style', 'font_size_pt', 'underline', 'line_width',
+               'draw_color', 'fill_color', 'text_color', 'color_flag', 'ws', 'lasth']
+EXIT_STATE = ENTRY_STATE + ['font_size', 'x', 'y']
+
+FORM_OP = re.compile(r'/X(\d+) Do')
+# a form costs its own pdf object, so one placed fewer times than this is drawn inline again
+FORM_MIN_USES = 3
+# a page at least this long that's repeated in the pdf is written out once, as a form each copy places
+PAGE_FORM_MIN_BYTES = 1024
+
+
+class PageLimit(Exception):
+    '''
+        raised when content would break onto a page past the pdf's page limit, see PDF.clip
+    '''
+
 
 class PDF(FPDF, HTMLMixin):
-    pass
+    # bytes saved by downscaling the images embedded in this pdf, see plgspl.images
+    image_bytes_saved = 0
+    # whether content that runs past its maxPages budget is cut short rather than stopping the run
+    truncate = settings.truncate_overflow
+    # the last page content may break onto, while clipping
+    page_limit = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # what was cut short, in render order
+        self.truncated = []
+        # the content of each form xobject, numbered in order, and how many times each is placed. see stamp
+        self.forms = dict()
+        self.form_count = 0
+        self.form_uses = collections.Counter()
+        # [ops, exit state, ops that restore the page state, form] by what was stamped and the state it started from
+        self.stamps = dict()
+        self.stamping = False
+        # [(first page, offset, last page, offset), exit state, truncated] by what was drawn
+        # and the state it started from. see reuse
+        self.kept = dict()
+        # how many times content was asked to be reused, and how many times it was
+        self.reusable = 0
+        self.reused = 0
+        # (form, object number) of the forms written out
+        self.form_objects = []
+
+    def accept_page_break(self):
+        if self.page_limit and self.page >= self.page_limit:
+            raise PageLimit()
+        return super().accept_page_break()
+
+    def clip(self, page_number, info, render):
+        '''
+            calls render, whose content should end by page_number.
+            when truncating, content that would break past page_number is dropped,
+            and the page ends with a marker pointing graders to the original submission.
+        '''
+        if not self.truncate:
+            return render()
+        outer = self.page_limit
+        self.page_limit = min(page_number, outer) if outer else page_number
+        try:
+            render()
+        except PageLimit:
+            self.mark_truncated(info)
+        finally:
+            self.page_limit = outer
+
+    def truncate_to(self, page_number, info):
+        '''
+            drops every page after page_number, marking the last one as truncated
+        '''
+        for n in range(page_number + 1, self.page + 1):
+            self.pages.pop(n, None)
+            self.page_links.pop(n, None)
+            self.orientation_changes.pop(n, None)
+        self.page = page_number
+        # content kept on the dropped pages can't be copied anymore
+        self.kept = {entry: kept for entry, kept in self.kept.items() if kept[0][2] <= page_number}
+        self.mark_truncated(info)
+
+    def mark_truncated(self, info):
+        '''
+            writes the truncation marker in the bottom margin of the current page
+        '''
+        self.truncated.append(info)
+        if self.ws > 0:
+            self.ws = 0
+            self._out('0 Tw')
+        auto, margin = self.auto_page_break, self.b_margin
+        y = self.page_break_trigger
+        self.set_auto_page_break(False)
+        # the page may not have set the current font, so set it again
+        self.font_family = ''
+        self.set_font(settings.body_font.font, size=settings.body_font.size)
+        self.set_fill_color(230)
+        self.set_xy(self.l_margin, y)
+        self.cell(0, 8, f'Truncated: {info} runs past its page budget. See the original submission.', fill=1, ln=1)
+        self.set_auto_page_break(auto, margin)
+
+    def put_image(self, name, data: bytes, w=0, h=0):
+        '''
+            puts the image with the given bytes on the page, registered under name.
+            images are parsed once per process by content, so the same picture from another student
+            or another output pdf reuses the parsed data. fpdf only parses images from a path,
+            so a new image passes through a short-lived temporary file.
+        '''
+        if name in self.images:
+            return self.image(name, w=w, h=h)
+        try:
+            self.place_image(name, data, w, h)
+        except PageLimit:
+            # the image was cut by its page budget, so it isn't embedded at all
+            self.images.pop(name, None)
+            raise
+
+    def place_image(self, name, data: bytes, w=0, h=0):
+        key = digest(data)
+        cached = image_cache.get(key)
+        if cached is not None:
+            info, saved = cached
+            self.images[name] = dict(info, i=len(self.images) + 1)
+            self.image_bytes_saved += saved
+            # fpdf bumps the version when it parses an image with an alpha channel
+            if 'smask' in info and self.pdf_version < '1.4':
+                self.pdf_version = '1.4'
+            return self.image(name, w=w, h=h)
+        ext = os.path.splitext(name)[1]
+        embedded = images.prepare(key, data, ext[1:], w)
+        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+            tmp.write(embedded)
+        try:
+            self.image(tmp.name, w=w, h=h)
+        finally:
+            os.unlink(tmp.name)
+            if tmp.name in self.images:
+                self.images[name] = self.images.pop(tmp.name)
+        saved = len(data) - len(embedded)
+        self.image_bytes_saved += saved
+        # copied, as fpdf drops the image data from its own entry once it's written out
+        image_cache.put(key, ({k: v for k, v in self.images[name].items() if k != 'i'}, saved))
+
+    def stamp(self, key, draw):
+        '''
+            draws content that's the same for every student, like headers and blank page padding.
+            the first time it's drawn, its ops are kept. from then on, it's a form xobject placed with a
+            single operator. key names the content. forms are kept per cursor position and pdf state,
+            so placing one leaves the page and the pdf as drawing it would have.
+        '''
+        if self.stamping or self.page == 0:
+            return draw()
+        entry = (key, self.x, self.y, self.page_break_trigger) + \
+            tuple(getattr(self, k) for k in ENTRY_STATE)
+        stamped = self.stamps.get(entry)
+        if stamped is None:
+            page, start = self.page, len(self.pages[self.page])
+            self.stamping = True
+            try:
+                draw()
+            finally:
+                self.stamping = False
+            # content that broke onto another page can't be placed as a form
+            if self.page == page:
+                self.stamps[entry] = [self.pages[page][start:], {k: getattr(self, k) for k in EXIT_STATE},
+                                      self.restore_ops(entry[4:]), None]
+            return
+        ops, exit_state, restore, form = stamped
+        if form is None:
+            form = stamped[3] = self.add_form(ops)
+        self.restore_state(exit_state)
+        self.form_uses[form] += 1
+        self._out(f'/X{form} Do' + restore)
+
+    def reuse(self, key, render):
+        '''
+            renders content that may repeat from one student to the next, like identical answers.
+            unlike stamp, the content may run over several pages. the first time it's rendered, the span it drew is noted.
+            from then on, content with the same key that starts from the same cursor position and pdf state
+            is placed by copying those pages rather than rendering it again.
+        '''
+        self.reusable += 1
+        if self.stamping or self.page_limit or self.page == 0:
+            return render()
+        entry = (key, self.x, self.y, self.page_break_trigger) + \
+            tuple(getattr(self, k) for k in ENTRY_STATE)
+        kept = self.kept.get(entry)
+        if kept is None:
+            page, start, truncated = self.page, len(self.pages[self.page]), len(self.truncated)
+            render()
+            # links point at page numbers, so pages holding them aren't copied
+            if not any(self.page_links.get(n) for n in range(page, self.page + 1)):
+                self.kept[entry] = [(page, start, self.page, len(self.pages[self.page])),
+                                    {k: getattr(self, k) for k in EXIT_STATE}, self.truncated[truncated:]]
+            return
+        (page, start, last, end), exit_state, truncated = kept
+        if page == last:
+            pages = [self.pages[page][start:end]]
+        else:
+            pages = [self.pages[page][start:]] + [self.pages[n] for n in range(page + 1, last)] + \
+                [self.pages[last][:end]]
+        self.pages[self.page] += pages[0]
+        for ops in pages[1:]:
+            self.page += 1
+            self.pages[self.page] = ops
+        self.restore_state(exit_state)
+        self.truncated.extend(truncated)
+        self.form_uses.update(int(i) for ops in pages for i in FORM_OP.findall(ops))
+        self.reused += 1
+
+    def restore_state(self, state):
+        '''
+            sets the pdf back to a state kept by stamp or reuse
+        '''
+        for k, v in state.items():
+            setattr(self, k, v)
+        if self.font_family:
+            self.current_font = self.fonts[self.font_family + self.font_style]
+            self.unifontsubset = self.current_font['type'] == 'TTF'
+
+    def restore_ops(self, entry):
+        '''
+            returns the ops that carry the state the stamped content left the pdf in past the form,
+            as the page's state is restored once the form is drawn
+        '''
+        state = dict(zip(ENTRY_STATE, entry))
+        ops = ''
+        if (self.font_family, self.font_style, self.font_size_pt) != \
+                (state['font_family'], state['font_style'], state['font_size_pt']):
+            ops += '\nBT /F%d %.2f Tf ET' % (self.current_font['i'], self.font_size_pt)
+        if self.line_width != state['line_width']:
+            ops += '\n%.2f w' % (self.line_width * self.k)
+        if self.draw_color != state['draw_color']:
+            ops += '\n' + self.draw_color
+        if self.fill_color != state['fill_color']:
+            ops += '\n' + self.fill_color
+        if self.ws != state['ws']:
+            ops += '\n%.3f Tw' % (self.ws * self.k)
+        return ops
+
+    def add_form(self, ops) -> int:
+        '''
+            returns the number of the form xobject drawing ops, adding it if it's new
+        '''
+        i = self.forms.get(ops)
+        if i is None:
+            self.form_count += 1
+            i = self.forms[ops] = self.form_count
+        return i
+
+    def _putpages(self):
+        inline = {i: ops for ops, i in self.forms.items()
+                  if self.form_uses[i] < FORM_MIN_USES}
+        if inline:
+            def place(m):
+                ops = inline.get(int(m.group(1)))
+                return m.group(0) if ops is None else 'q\n' + ops + 'Q'
+            for n, page in self.pages.items():
+                if '/X' in page:
+                    self.pages[n] = FORM_OP.sub(place, page)
+            for ops in inline.values():
+                del self.forms[ops]
+        repeated = dict()
+        for n, page in self.pages.items():
+            if len(page) >= PAGE_FORM_MIN_BYTES:
+                repeated.setdefault(page, []).append(n)
+        for page, numbers in repeated.items():
+            if len(numbers) > 1:
+                place = f'/X{self.add_form(page)} Do'
+                for n in numbers:
+                    self.pages[n] = place
+        super()._putpages()
+
+    def _putimages(self):
+        super()._putimages()
+        filter = '/Filter /FlateDecode ' if self.compress else ''
+        for ops, i in self.forms.items():
+            data = ops.encode('latin1')
+            if self.compress:
+                data = zlib.compress(data)
+            self._newobj()
+            self.form_objects.append((i, self.n))
+            self._out(f'<</Type /XObject /Subtype /Form /BBox [0 0 {self.w_pt:.2f} {self.h_pt:.2f}] '
+                      f'/Resources 2 0 R {filter}/Length {len(data)}>>')
+            self._putstream(data)
+            self._out('endobj')
+
+    def _putxobjectdict(self):
+        super()._putxobjectdict()
+        for i, n in self.form_objects:
+            self._out(f'/X{i} {n} 0 R')
+
+    def check_pages(self, page_number, info='', budget=None):
+        '''
+            called once content that should end by page_number has been rendered.
+            budget names the maxPages setting the page number comes from, if any.
+            running over dumps the pdf so far as incomplete_assignment.pdf and exits.
+        '''
+        if self.page_no() > page_number:
+            print('Warning: A question exceeds expected length. Please re-adjust your configuration.', info)
+            print('Dumping current pdf as incomplete_assignment.pdf')
+            self.output(os.path.join(os.getcwd(), 'incomplete_assignment.pdf'))
+            exit(1)
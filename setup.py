@@ -5,6 +5,7 @@ setup(
     version='0.0.0',
     packages=['plgspl'],
     install_requires=['fpdf', 'pandas', 'numpy', 'markdown2', 'unidecode'],
+    extras_require={'images': ['Pillow']},
     entry_points={
         'console_scripts': [
             'plgspl = plgspl.plgspl:main'
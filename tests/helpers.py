@@ -0,0 +1,41 @@
+import os
+import re
+import subprocess
+import sys
+from plgspl.synthetic import generate
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def run(cwd, seed, *args):
+    '''
+        runs python with the given arguments in a fresh process with the given hash seed
+    '''
+    path = [ROOT] + ([os.environ['PYTHONPATH']] if os.environ.get('PYTHONPATH') else [])
+    env = dict(os.environ, PYTHONHASHSEED=str(seed), PYTHONPATH=os.pathsep.join(path))
+    return subprocess.run([sys.executable, *args], cwd=cwd, env=env, stdout=subprocess.DEVNULL)
+
+
+def plgspl(cwd, seed, *args):
+    '''
+        runs the plgspl cli in a fresh process with the given hash seed
+    '''
+    run(cwd, seed, '-m', 'plgspl', *args).check_returncode()
+
+
+def pdfs(out_dir):
+    '''
+        the pdfs in out_dir by name, without their creation dates
+    '''
+    return {fn: re.sub(rb'/CreationDate \(D:\d+\)', b'', open(os.path.join(out_dir, fn), 'rb').read())
+            for fn in os.listdir(out_dir) if fn.endswith('.pdf')}
+
+
+def export(data_dir):
+    '''
+        generates a small export with uploads, that renders to several output pdfs.
+        returns the pdf command's inputs.
+    '''
+    generate(str(data_dir), students=40, questions=3, parts=2, file_questions=1,
+             code_lines=5, md_paragraphs=1, image_size=32)
+    return [str(data_dir / 'info.json'), str(data_dir / 'ans.csv'), str(data_dir / 'files')]
@@ -0,0 +1,69 @@
+import json
+import os
+import pytest
+from plgspl.batch import batch, load_manifest
+from plgspl.synthetic import generate
+
+SAMPLE = os.path.join(os.path.dirname(__file__), '..', 'res', 'plgspl_v2_sample')
+
+
+def write_manifest(path, manifest):
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+
+def test_failing_job_is_reported_and_the_batch_moves_on(tmp_path):
+    # a qmap without the gradescope csv's students, so merge raises a KeyError
+    (tmp_path / 'bad_qmap.json').write_text('{}')
+    (tmp_path / 'pl.csv').write_text('UID,UIN\na@x.edu,1\n')
+    manifest = write_manifest(tmp_path / 'manifest.json', {'jobs': [
+        {'merge': ['bad_qmap.json', os.path.abspath(os.path.join(SAMPLE, 'gs_scores.csv'))]},
+        {'classlist': ['pl.csv'], 'out': 'classlist'},
+    ]})
+    summary = tmp_path / 'summary.json'
+
+    with pytest.raises(SystemExit) as e:
+        batch(manifest, str(summary))
+    assert e.value.code == 1
+
+    jobs = json.load(open(summary))['jobs']
+    assert [job['status'] for job in jobs] == ['failed', 'ok']
+    assert 'KeyError' in jobs[0]['error']
+    assert os.path.isfile(tmp_path / 'classlist' / 'classlist.csv')
+
+
+
+def test_failing_pdf_job_drops_its_queued_pdfs(tmp_path):
+    # about a dozen pdfs, the second of which can't be rendered
+    generate(str(tmp_path / 'data'), students=220, questions=3, parts=2, file_questions=1,
+             code_lines=5, md_paragraphs=1, image_size=32)
+    (tmp_path / 'data' / 'files' / 'student00030@example.edu_30_q3_93_picture.png').write_text('not a png')
+    (tmp_path / 'pl.csv').write_text('UID,UIN\na@x.edu,1\n')
+    manifest = write_manifest(tmp_path / 'manifest.json', {'workers': 2, 'jobs': [
+        {'pdf': ['data/info.json', 'data/ans.csv', 'data/files'], 'out': 'broken'},
+        {'classlist': ['pl.csv'], 'out': 'classlist'},
+    ]})
+    summary = tmp_path / 'summary.json'
+
+    with pytest.raises(SystemExit):
+        batch(manifest, str(summary))
+
+    jobs = json.load(open(summary))['jobs']
+    assert [job['status'] for job in jobs] == ['failed', 'ok']
+    assert 'Not a PNG file' in jobs[0]['error']
+    # only the pdfs rendering alongside the broken one are finished, the rest are never started
+    rendered = [fn for fn in os.listdir(tmp_path / 'broken') if fn.endswith('.pdf') and 'sample' not in fn]
+    assert 0 < len(rendered) <= 4
+    checkpoint = tmp_path / 'broken' / 'Synthetic_Assessment_checkpoint.jsonl'
+    assert len(open(checkpoint).read().splitlines()) == len(rendered) + 1
+
+@pytest.mark.parametrize('workers', ['4', 0, -1, 1.5, True])
+def test_manifest_workers_must_be_a_positive_number(tmp_path, workers):
+    manifest = write_manifest(tmp_path / 'manifest.json', {'workers': workers, 'jobs': []})
+    with pytest.raises(SystemExit):
+        load_manifest(manifest)
+
+
+def test_manifest_workers_default_to_one(tmp_path):
+    manifest = write_manifest(tmp_path / 'manifest.json', {'jobs': []})
+    assert load_manifest(manifest) == (1, [])
@@ -0,0 +1,69 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from plgspl.checkpoint import Checkpoint
+from tests.helpers import export, pdfs, plgspl, run
+
+# stops a pdf run once its first output pdf is written, as a crash would
+INTERRUPT = '''
+import sys
+from plgspl.to_pdf import to_pdf
+
+def progress(done, total):
+    if done:
+        raise KeyboardInterrupt()
+
+to_pdf(*sys.argv[1:], progress=progress)
+'''
+
+
+def test_resume_matches_an_uninterrupted_run_under_any_hash_seed(tmp_path):
+    inputs = export(tmp_path / 'data')
+    single, resumed = tmp_path / 'single', tmp_path / 'resumed'
+    single.mkdir()
+    resumed.mkdir()
+
+    plgspl(single, 0, 'pdf', *inputs)
+    assert run(resumed, 1, '-c', INTERRUPT, *inputs).returncode != 0
+    checkpoint = resumed / 'Synthetic_Assessment_checkpoint.jsonl'
+    # the header, the first pdf, and any the writer finished as the run stopped
+    recorded = len(open(checkpoint).read().splitlines()) - 1
+    assert 1 <= recorded < len(pdfs(single)) - 1
+    plgspl(resumed, 2, 'pdf', *inputs, '--resume')
+
+    assert not os.path.exists(checkpoint)
+    assert pdfs(resumed) == pdfs(single)
+    for fn in ['Synthetic_Assessment_qmap.json', 'Synthetic_Assessment_pdfs.json']:
+        assert json.load(open(resumed / fn)) == json.load(open(single / fn))
+
+
+def test_chunk_is_recorded_once_written(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / 'a_checkpoint.jsonl'), 'run')
+    checkpoint.start('template', 10, 25)
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        # nothing waits on these, as when a run crashes while the writer finishes
+        written = writer.submit(lambda: (['missing'], []))
+        failed = writer.submit(lambda: 1 / 0)
+        checkpoint.record_when_written(written, 0, str(tmp_path / 'a_1-25.pdf'), {'uid': []})
+        checkpoint.record_when_written(failed, 25, str(tmp_path / 'a_25-50.pdf'), {'other': []})
+
+    resumed = Checkpoint(checkpoint.path, 'run')
+    resumed.read()
+    assert list(resumed.chunks) == [0]
+    assert resumed.chunks[0]['name'] == 'a_1-25.pdf'
+    assert resumed.chunks[0]['missing'] == ['missing']
+
+
+def test_chunks_written_after_close_are_not_recorded(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / 'a_checkpoint.jsonl'), 'run')
+    checkpoint.start('template', 10, 25)
+    checkpoint.record(0, str(tmp_path / 'a_1-25.pdf'), ([], []), {'uid': []})
+    checkpoint.close()
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        # a chunk the stopped run left behind
+        late = writer.submit(lambda: ([], []))
+        checkpoint.record_when_written(late, 25, str(tmp_path / 'a_25-50.pdf'), {'other': []})
+
+    resumed = Checkpoint(checkpoint.path, 'run')
+    resumed.read()
+    assert list(resumed.chunks) == [0]
@@ -0,0 +1,57 @@
+import os
+import shutil
+import pandas as pd
+from plgspl.files import FileIndex, escape_qid, parse_filename
+
+SAMPLE = os.path.join(os.path.dirname(__file__), '..', 'res', 'plgspl_v2_sample')
+FILES = os.path.join(SAMPLE, 'files')
+EXPECTED = {'playListAns.cpp', 'mdtest.md', 'picture.png'}
+
+
+def scan(file_dir, uid_full, qid, sid, expected_files):
+    '''
+        the per-row directory scan that FileIndex replaced
+    '''
+    return [os.path.join(file_dir, fn) for fn in os.listdir(file_dir)
+            if fn.find(uid_full) > -1 and fn.find(f'{escape_qid(qid)}_{sid}') > -1
+            and parse_filename(fn, qid) in expected_files]
+
+
+def rows():
+    manual = pd.read_csv(os.path.join(SAMPLE, 'ans.csv'))
+    return [(m['uid'], m['qid'], m['submission_id']) for _, m in manual.iterrows()]
+
+
+def test_find_matches_scan_on_sample():
+    qids = [qid for _, qid, _ in rows()]
+    index = FileIndex.from_dir(FILES, qids)
+    found = 0
+    for uid, qid, sid in rows():
+        expected = scan(FILES, uid, qid, sid, EXPECTED)
+        assert index.find(uid, qid, sid, EXPECTED) == expected
+        found += len(expected)
+    assert found > 0
+
+
+def test_find_matches_scan_on_zip(tmp_path):
+    archive = shutil.make_archive(str(tmp_path / 'files'), 'zip', FILES)
+    qids = [qid for _, qid, _ in rows()]
+    index = FileIndex.from_zip(archive, qids)
+    for uid, qid, sid in rows():
+        expected = [os.path.basename(p) for p in scan(FILES, uid, qid, sid, EXPECTED)]
+        assert sorted(index.find(uid, qid, sid, EXPECTED)) == sorted(expected)
+
+
+def test_find_matches_scan_on_overlapping_names(tmp_path):
+    # submission ids that prefix each other, and qids that contain each other
+    names = ['a@x.edu_1_q_7_main.cpp', 'a@x.edu_1_q_71_main.cpp', 'a@x.edu_1_q_q_7_main.cpp',
+             'a@x.edu_1_p_q_7_main.cpp', 'b@x.edu_2_q_7_main.cpp', 'a@x.edu_1_q_7_other.md']
+    for fn in names:
+        (tmp_path / fn).write_text('')
+    qids = ['q', 'q_q', 'p/q']
+    index = FileIndex.from_dir(str(tmp_path), qids)
+    for uid in ['a@x.edu', 'b@x.edu']:
+        for qid in qids:
+            for sid in [7, 71, 1]:
+                assert sorted(index.find(uid, qid, sid, {'main.cpp'})) == \
+                    sorted(scan(str(tmp_path), uid, qid, sid, {'main.cpp'}))
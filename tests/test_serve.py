@@ -0,0 +1,157 @@
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+from plgspl.serve import JobOutput, make_server
+from plgspl.synthetic import generate
+
+SAMPLE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'res', 'plgspl_v2_sample'))
+
+
+@pytest.fixture
+def server(request):
+    # a test can ask for workers with indirect parametrization
+    server = make_server(port=0, workers=getattr(request, 'param', 1), token='secret')
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    server.daemon.close()
+
+
+def call(server, method, path, body=None, **headers):
+    '''
+        sends a request to the server, returning the status and the decoded reply
+    '''
+    host, port = server.server_address
+    headers = {'Authorization': 'Bearer secret', 'Content-Type': 'application/json', **headers}
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(f'http://{host}:{port}{path}', data=data, method=method,
+                                 headers={k: v for k, v in headers.items() if v is not None})
+    try:
+        with urllib.request.urlopen(req) as r:
+            return r.status, json.load(r)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def wait(server, id):
+    while True:
+        status, job = call(server, 'GET', f'/jobs/{id}')
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+
+
+def log_jobs(monkeypatch):
+    '''
+        pytest swaps stdout again once a test starts, replacing the one the daemon installed
+    '''
+    monkeypatch.setattr(sys, 'stdout', JobOutput(sys.stdout))
+
+
+def rendered(out_dir):
+    return sorted(fn for fn in os.listdir(out_dir) if fn.endswith('.pdf') and 'sample' not in fn)
+
+
+def test_pdf_job_runs_and_logs_its_own_output(capsys, monkeypatch, server, tmp_path):
+    log_jobs(monkeypatch)
+    status, job = call(server, 'POST', '/jobs', {
+        'pdf': [os.path.join(SAMPLE, f) for f in ('info.json', 'ans.csv', 'files')], 'out': str(tmp_path)})
+    assert status == 202
+    print('not from the job')
+    job = wait(server, job['id'])
+    assert job['status'] == 'done', job['log']
+    assert job['progress'] == {'pdfs': 1, 'total': 1}
+    assert 'Parsing config for Examlet_Five' in job['log']
+    assert 'not from the job' not in job['log']
+    assert 'not from the job' in capsys.readouterr().out
+    assert os.path.isfile(tmp_path / 'Examlet_Five_qmap.json')
+    assert os.path.isfile(tmp_path / 'Examlet_Five_pdfs.json')
+
+
+
+@pytest.mark.parametrize('server', [2], indirect=True)
+def test_pdf_job_logs_its_workers_output(monkeypatch, server, tmp_path):
+    log_jobs(monkeypatch)
+    # multiple choice answers repeat, so the worker reports questions it deduplicated
+    generate(str(tmp_path / 'data'), students=60, questions=2, parts=1, part_types=['mc'], file_questions=0)
+    status, job = call(server, 'POST', '/jobs', {
+        'pdf': [str(tmp_path / 'data' / 'info.json'), str(tmp_path / 'data' / 'ans.csv')], 'out': str(tmp_path)})
+    job = wait(server, job['id'])
+    assert job['status'] == 'done', job['log']
+    assert 'Synthetic_Assessment_1-60.pdf: 4 of 120 questions were identical' in job['log']
+
+
+@pytest.mark.parametrize('server', [2], indirect=True)
+def test_cancelled_job_stops_writing_pdfs(server, tmp_path):
+    generate(str(tmp_path / 'data'), students=220, questions=3, parts=2, file_questions=1,
+             code_lines=5, md_paragraphs=1, image_size=32)
+    status, job = call(server, 'POST', '/jobs', {
+        'pdf': [str(tmp_path / 'data' / f) for f in ('info.json', 'ans.csv', 'files')], 'out': str(tmp_path)})
+    while not (call(server, 'GET', f"/jobs/{job['id']}")[1]['progress'] or {}).get('pdfs'):
+        time.sleep(0.01)
+    assert call(server, 'DELETE', f"/jobs/{job['id']}")[0] == 200
+    assert wait(server, job['id'])['status'] == 'cancelled'
+
+    # the pdfs rendering when it was cancelled are finished, and the rest never start
+    written = rendered(tmp_path)
+    assert len(written) <= 6
+    time.sleep(1)
+    assert rendered(tmp_path) == written
+    checkpoint = tmp_path / 'Synthetic_Assessment_checkpoint.jsonl'
+    assert len(open(checkpoint).read().splitlines()) == len(written) + 1
+
+
+@pytest.mark.parametrize('headers', [
+    {'Authorization': None},
+    {'Authorization': 'Bearer wrong'},
+])
+def test_requests_need_the_token(server, headers):
+    assert call(server, 'GET', '/', **headers)[0] == 401
+    assert call(server, 'POST', '/jobs', {'classlist': ['pl.csv']}, **headers)[0] == 401
+    assert call(server, 'POST', '/shutdown', **headers)[0] == 401
+    assert server.daemon.jobs == {}
+
+
+@pytest.mark.parametrize('headers', [
+    # dns rebinding, where a page's own name resolves to 127.0.0.1
+    {'Host': 'evil.example:8765'},
+    # a page on another site
+    {'Origin': 'http://evil.example'},
+    {'Origin': 'null'},
+])
+def test_requests_from_other_sites_are_refused(server, headers):
+    assert call(server, 'GET', '/jobs', **headers)[0] == 403
+    assert call(server, 'POST', '/jobs', {'classlist': ['pl.csv']}, **headers)[0] == 403
+    assert server.daemon.jobs == {}
+
+
+def test_jobs_must_be_sent_as_json(server, tmp_path):
+    (tmp_path / 'pl.csv').write_text('UID,UIN\na@x.edu,1\n')
+    # a form or text/plain post is the kind a web page can send without asking first
+    status, _ = call(server, 'POST', '/jobs', {'classlist': [str(tmp_path / 'pl.csv')]}, **{'Content-Type': 'text/plain'})
+    assert status == 415
+    assert server.daemon.jobs == {}
+
+
+def test_bad_jobs_and_unknown_paths(server):
+    assert call(server, 'POST', '/jobs', {'pdf': ['nope.json', 'nope.csv']})[0] == 400
+    assert call(server, 'POST', '/jobs', ['not', 'a', 'job'])[0] == 400
+    assert call(server, 'GET', '/jobs/1')[0] == 404
+    assert call(server, 'DELETE', '/jobs/1')[0] == 404
+
+
+def test_finished_jobs_cannot_be_cancelled(server, tmp_path):
+    (tmp_path / 'pl.csv').write_text('UID,UIN\na@x.edu,1\n')
+    status, job = call(server, 'POST', '/jobs', {'classlist': [str(tmp_path / 'pl.csv')], 'out': str(tmp_path)})
+    assert status == 202
+    assert wait(server, job['id'])['status'] == 'done'
+    assert os.path.isfile(tmp_path / 'classlist.csv')
+    assert call(server, 'DELETE', f"/jobs/{job['id']}")[0] == 409
@@ -0,0 +1,21 @@
+import json
+from tests.helpers import export, pdfs, plgspl
+
+
+def test_shards_match_a_single_run_under_any_hash_seed(tmp_path):
+    inputs = export(tmp_path / 'data')
+    single, sharded = tmp_path / 'single', tmp_path / 'sharded'
+    single.mkdir()
+    sharded.mkdir()
+
+    plgspl(single, 0, 'pdf', *inputs)
+    # each shard is its own process, and may run on another machine
+    plgspl(sharded, 1, 'pdf', *inputs, '--shard', '1/2')
+    plgspl(sharded, 2, 'pdf', *inputs, '--shard', '2/2')
+    plgspl(sharded, 3, 'combine', *(str(sharded / f'Synthetic_Assessment_shard-{i}-of-2.json') for i in (1, 2)))
+
+    expected = pdfs(single)
+    assert len(expected) > 3
+    assert pdfs(sharded) == expected
+    for fn in ['Synthetic_Assessment_qmap.json', 'Synthetic_Assessment_pdfs.json']:
+        assert json.load(open(sharded / fn)) == json.load(open(single / fn))